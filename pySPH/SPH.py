@@ -4,9 +4,13 @@
 SPH data representation for Sphere framework
 """
 from __future__ import print_function
+import os
 import sys
 import struct
+import asyncio
+import functools
 import numpy
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 
 class SPH:
@@ -17,10 +21,15 @@ class SPH:
     """ data type """
     (DT_SINGLE, DT_DOUBLE) = (1, 2)
 
+    """ chunk size in bytes for data record I/O """
+    IO_CHUNK = 16 * 1024 * 1024
+
     def __init__(self):
         """
         class initializer
         """
+        self._quiet = False
+        self._lastError = None
         self.reset()
         return
 
@@ -92,14 +101,22 @@ class SPH:
 
     @property
     def min(self):
+        if self._min is None: self._calcMinMax()
         return self._min
 
     @property
     def max(self):
+        if self._max is None: self._calcMinMax()
         return self._max
 
     @property
     def data(self):
+        """
+        data array. normally a 1-dim array in file order (X fastest, vector
+        components interleaved), but blocks made by divide.divideBlocks
+        (copy=False) hold a (Z, Y, X[, veclen]) view of the source data.
+        use dataIndexed() for indexing that works for both.
+        """
         return self._data
 
     @property
@@ -109,22 +126,35 @@ class SPH:
     def path(self, v:str):
         self._path = v
 
-    def load(self, path):
+    @property
+    def lastError(self):
+        """ message of the last failure, or None """
+        return getattr(self, '_lastError', None)
+
+    @property
+    def quiet(self):
+        return getattr(self, '_quiet', False)
+    @quiet.setter
+    def quiet(self, v:bool):
+        self._quiet = v
+
+    def _error(self, msg):
         """
-        load from .sph file
-         @param path: file path of the .sph file
-         @returns: True for succeed or False for failed.
+        record a failure message, and print it unless quiet
+         @param msg: message
         """
-        self._data = None
-        self._path = None
-
-        # open file
-        try:
-            ifp = open(path, "rb")
-        except:
-            print("SPH.load: open failed: %s" % path)
-            return False
+        self._lastError = msg
+        if not getattr(self, '_quiet', False):
+            print(msg)
+        return
 
+    def _readHeader(self, ifp):
+        """
+        read header records of .sph file
+         @param ifp: file object positioned at the top of the .sph file
+         @returns: byte order character of the file ('<' or '>'),
+                   or None for failed. ifp is left at the data record.
+        """
         # type record
         bo = '<'
         header = ifp.read(16)
@@ -145,16 +175,14 @@ class SPH:
             elif ( svType == 2 ):
                 self._veclen = 3
             else:
-                ifp.close()
-                return False
+                return None
 
         if ( dType == 1 ):
             self._dtype = SPH.DT_SINGLE
         elif ( dType == 2 ):
             self._dtype = SPH.DT_DOUBLE
         else:
-            ifp.close()
-            return False
+            return None
 
         # size record
         if ( dType == 1 ):
@@ -200,77 +228,238 @@ class SPH:
 
         # skip data sz
         ifp.read(4)
+        return bo
+
+    def load(self, path, mmap=False):
+        """
+        load from .sph file
+         @param path: file path of the .sph file
+         @param mmap: if True, map the data record with numpy.memmap instead
+                      of reading it. _data becomes a read-only view backed by
+                      the page cache, and min/max are calculated on first
+                      access.
+         @returns: True for succeed or False for failed.
+        """
+        self._data = None
+        self._path = None
 
+        # open file
+        try:
+            ifp = open(path, "rb")
+        except:
+            self._error("SPH.load: open failed: %s" % path)
+            return False
+
+        # header records
+        try:
+            bo = self._readHeader(ifp)
+        except:
+            bo = None
+        if bo is None:
+            self._error("SPH.load: invalid header: %s" % path)
+            ifp.close()
+            return False
+
+        # data record
         dimSz = self._dims[0] * self._dims[1] * self._dims[2]
-        if ( svType == 1 ):
-            self._min = [0.0,]
-            self._max = [0.0,]
-            if ( dType == 1 ):
-                packStr = 'f'
-                dlen = 4
-                self._data = numpy.array(0, dtype=numpy.float32)
-            else:
-                packStr = 'd'
-                dlen = 8
-                self._data = numpy.array(0, dtype=numpy.float64)
+        if self._dtype == SPH.DT_SINGLE:
+            ndt = numpy.dtype(bo + 'f4')
         else:
-            self._min = [0.0, 0.0, 0.0]
-            self._max = [0.0, 0.0, 0.0]
-            if ( dType == 1 ):
-                packStr = 'fff'
-                dlen = 12
-                self._data = numpy.array(0, dtype=numpy.float32)
-            else:
-                packStr = 'ddd'
-                dlen = 24
-                self._data = numpy.array(0, dtype=numpy.float64)
-        self._data.resize(dimSz*self._veclen)
-
-        # read the first data
-        vals = struct.unpack(bo+packStr, ifp.read(dlen))
-        for l in range(0, self._veclen):
-            self._data[l] = vals[l]
-            self._min[l] = vals[l]
-            self._max[l] = vals[l]
-
-        # read datas folowing
-        for i in range(1, dimSz):
-            vals = struct.unpack(bo+packStr, ifp.read(dlen))
-            for l in range(0, self._veclen):
-                self._data[i*self._veclen + l] = vals[l]
-                if ( self._min[l] > vals[l] ):
-                    self._min[l] = vals[l]
-                elif ( self._max[l] < vals[l] ):
-                    self._max[l] = vals[l]
+            ndt = numpy.dtype(bo + 'f8')
+        if mmap:
+            offset = ifp.tell()
+            ifp.close()
+            try:
+                self._data = numpy.memmap(path, dtype=ndt, mode='r',
+                                          offset=offset,
+                                          shape=(dimSz*self._veclen,))
+            except:
+                self._error("SPH.load: mmap failed: %s" % path)
+                return False
+            self._min = None
+            self._max = None
+            self._path = path
+            return True
+        try:
+            arr = numpy.fromfile(ifp, dtype=ndt, count=dimSz*self._veclen)
+        except:
+            self._error("SPH.load: data read failed: %s" % path)
+            ifp.close()
+            return False
+        if arr.size != dimSz*self._veclen:
+            self._error("SPH.load: data record too short: %s" % path)
+            ifp.close()
+            return False
+        self._data = arr.astype(ndt.newbyteorder('='), copy=False)
+        self._calcMinMax()
 
         # done
         ifp.close()
         self._path = path
         return True
 
-    def save(self, path =None, dtype =None):
+    def loadHeader(self, path):
         """
-        save to .sph file
-         @param path: file path of the .sph file. if None, use self._path
-         @param dtype: file dtype of the .sph file. if None, use self._dtype
+        load header records only from .sph file (data record is not read)
+         @param path: file path of the .sph file
          @returns: True for succeed or False for failed.
         """
-        if self._data is None: return False
-        xpath = path
-        if xpath is None: xpath = self._path
-        if xpath is None: return False
-        xtype = dtype
-        if xtype is None: xtype = self._dtype
-        if xtype is None: return False
+        self._data = None
+        self._path = None
 
-        # open output file
+        # open file
         try:
-            ofp = open(xpath, "wb")
+            ifp = open(path, "rb")
         except:
-            print("SPH.save: open failed: %s" % xpath)
+            self._error("SPH.loadHeader: open failed: %s" % path)
+            return False
+
+        # header records
+        try:
+            bo = self._readHeader(ifp)
+        except:
+            bo = None
+        ifp.close()
+        if bo is None:
+            self._error("SPH.loadHeader: invalid header: %s" % path)
+            return False
+
+        self._min = [0.0] * self._veclen
+        self._max = [0.0] * self._veclen
+        self._path = path
+        return True
+
+    @staticmethod
+    def _subBoxRanges(dims, xrange, yrange, zrange, stride):
+        """
+        normalize index ranges of a sub-box
+         @param dims: data array size (X, Y, Z)
+         @param xrange, yrange, zrange: index range (start, stop) of each
+                                        axis, stop is exclusive. None for
+                                        the whole axis.
+         @param stride: index stride of each axis
+         @returns: list of range objects (X, Y, Z), or None for invalid.
+        """
+        rngs = []
+        for a, r in enumerate((xrange, yrange, zrange)):
+            if r is None: r = (0, dims[a])
+            st = int(stride[a])
+            if st < 1 or r[0] < 0 or r[1] > dims[a] or r[0] >= r[1]:
+                return None
+            rngs.append(range(int(r[0]), int(r[1]), st))
+        return rngs
+
+    @staticmethod
+    def _readSubBox(ifp, offset, ndt, dims, veclen, rngs):
+        """
+        read sub-box of a data record by seeking to the rows needed
+         @param ifp: file object
+         @param offset: file offset of the first element of the data record
+         @param ndt: numpy.dtype of the elements in the file
+         @param dims: data array size (X, Y, Z) of the data record
+         @param veclen: vector length of each data
+         @param rngs: index ranges (X, Y, Z) from _subBoxRanges
+         @returns: numpy.ndarray of shape (Z, Y, X, veclen), native order
+        """
+        xr, yr, zr = rngs
+        nrow = xr[-1] - xr[0] + 1
+        rowSz = dims[0] * veclen * ndt.itemsize
+        arr = numpy.empty((len(zr), len(yr), len(xr), veclen),
+                          dtype=ndt.newbyteorder('='))
+        for kk, k in enumerate(zr):
+            if xr[0] == 0 and xr.step == 1 and nrow == dims[0] \
+               and yr.step == 1:
+                # whole rows in this plane are contiguous
+                ifp.seek(offset + (k * dims[1] + yr[0]) * rowSz)
+                buf = numpy.fromfile(ifp, dtype=ndt,
+                                     count=len(yr) * dims[0] * veclen)
+                arr[kk] = buf.reshape((len(yr), dims[0], veclen))
+                continue
+            for jj, j in enumerate(yr):
+                ifp.seek(offset + (k * dims[1] + j) * rowSz
+                         + xr[0] * veclen * ndt.itemsize)
+                buf = numpy.fromfile(ifp, dtype=ndt, count=nrow * veclen)
+                arr[kk, jj] = buf.reshape((nrow, veclen))[::xr.step]
+                continue # end of for(j)
+            continue # end of for(k)
+        return arr
+
+    def _setSubBox(self, arr, rngs):
+        """
+        setup _data and geometry from a sub-box read by _readSubBox
+         @param arr: numpy.ndarray returned by _readSubBox
+         @param rngs: index ranges (X, Y, Z) of the sub-box
+        """
+        for a in range(3):
+            self._org[a] = self._org[a] + self._pitch[a] * rngs[a][0]
+            self._pitch[a] = self._pitch[a] * rngs[a].step
+            self._dims[a] = len(rngs[a])
+        self._data = arr.reshape((-1))
+        self._calcMinMax()
+        return
+
+    def loadSubBox(self, path, xrange=None, yrange=None, zrange=None,
+                   stride=(1,1,1)):
+        """
+        load a sub-box of the grid from .sph file
+         @param path: file path of the .sph file
+         @param xrange: index range (start, stop) along X, stop is exclusive.
+                        None for the whole axis.
+         @param yrange: same as xrange along Y
+         @param zrange: same as xrange along Z
+         @param stride: index stride of each axis(default=(1,1,1))
+         @returns: True for succeed or False for failed.
+                   org, pitch and dims are adjusted to the sub-box.
+                   path is not set.
+        """
+        self._data = None
+        self._path = None
+
+        # open file
+        try:
+            ifp = open(path, "rb")
+        except:
+            self._error("SPH.loadSubBox: open failed: %s" % path)
+            return False
+
+        # header records
+        try:
+            bo = self._readHeader(ifp)
+        except:
+            bo = None
+        if bo is None:
+            self._error("SPH.loadSubBox: invalid header: %s" % path)
+            ifp.close()
             return False
-        self._dtype = xtype
 
+        rngs = SPH._subBoxRanges(self._dims, xrange, yrange, zrange, stride)
+        if rngs is None:
+            self._error("SPH.loadSubBox: invalid range specified.")
+            ifp.close()
+            return False
+        if self._dtype == SPH.DT_SINGLE:
+            ndt = numpy.dtype(bo + 'f4')
+        else:
+            ndt = numpy.dtype(bo + 'f8')
+        try:
+            arr = SPH._readSubBox(ifp, ifp.tell(), ndt, self._dims,
+                                  self._veclen, rngs)
+        except:
+            self._error("SPH.loadSubBox: data read failed: %s" % path)
+            ifp.close()
+            return False
+        ifp.close()
+
+        # path is left None (as loadFromFort), so that save() without a
+        # path does not overwrite the source file with the sub-box
+        self._setSubBox(arr, rngs)
+        return True
+
+    def _writeHeader(self, ofp):
+        """
+        write header records of .sph file (native byte order)
+         @param ofp: file object positioned at the top of the .sph file
+        """
         # attr record
         buff = [8, 1, 1, 8]
         if self._veclen == 3: buff[1] = 2
@@ -314,36 +503,86 @@ class SPH:
             ofp.write(struct.pack('i', 16))
         else:
             ofp.write(struct.pack('iifi', 8, self._step, self._time, 8))
+        return
+
+    def save(self, path =None, dtype =None):
+        """
+        save to .sph file
+         @param path: file path of the .sph file. if None, use self._path
+         @param dtype: file dtype of the .sph file. if None, use self._dtype
+         @returns: True for succeed or False for failed.
+        """
+        if self._data is None: return False
+        xpath = path
+        if xpath is None: xpath = self._path
+        if xpath is None: return False
+        xtype = dtype
+        if xtype is None: xtype = self._dtype
+        if xtype is None: return False
+
+        # open output file
+        try:
+            ofp = open(xpath, "wb")
+        except:
+            self._error("SPH.save: open failed: %s" % xpath)
+            return False
+        self._dtype = xtype
+
+        # header records
+        self._writeHeader(ofp)
 
         # data record
         dimSz = self._dims[0] * self._dims[1] * self._dims[2]
-        dimVX = self._veclen * self._dims[0]
-        k = 0
         if self._dtype == SPH.DT_DOUBLE:
-            dfmt = '%dd' % dimVX
-            ofp.write(struct.pack('i', dimSz*self._veclen*8))
-            for i in range(self._dims[2]):
-                for j in range(self._dims[1]):
-                    ofp.write(struct.pack(dfmt, *self._data[k:k+dimVX]))
-                    k = k + dimVX
-                    continue # end of for(j)
-                continue # end of for(i)
-            ofp.write(struct.pack('i', dimSz*self._veclen*8))
+            ndt = numpy.dtype('=f8')
         else:
-            dfmt = '%df' % dimVX
-            ofp.write(struct.pack('i', dimSz*self._veclen*4))
-            for i in range(self._dims[2]):
-                for j in range(self._dims[1]):
-                    ofp.write(struct.pack(dfmt, *self._data[k:k+dimVX]))
-                    k = k + dimVX
-                    continue # end of for(j)
-                continue # end of for(i)
-            ofp.write(struct.pack('i', dimSz*self._veclen*4))
+            ndt = numpy.dtype('=f4')
+        ofp.write(struct.pack('i', dimSz*self._veclen*ndt.itemsize))
+        self._writeData(ofp, ndt)
+        ofp.write(struct.pack('i', dimSz*self._veclen*ndt.itemsize))
 
         ofp.close()
         self._path = xpath
         return True
 
+    def _writeData(self, ofp, ndt):
+        """
+        write _data to a file directly from the array buffer.
+        dtype and byte order are converted in chunks of IO_CHUNK bytes.
+         @param ofp: file object
+         @param ndt: numpy.dtype of the elements in the file
+        """
+        chunk = max(1, SPH.IO_CHUNK // ndt.itemsize)
+        for piece in self._dataPieces():
+            SPH._writeArray(ofp, piece, ndt, chunk)
+        return
+
+    def _dataPieces(self):
+        """
+        generate _data as 1-dim arrays in file order. a strided view of
+        other data is flattened plane by plane to bound temporary memory.
+        """
+        dd = self._data
+        if dd.ndim > 1 and not dd.flags.c_contiguous:
+            for plane in dd:
+                yield plane.reshape((-1))
+            return
+        yield dd.reshape((-1))
+        return
+
+    @staticmethod
+    def _writeArray(ofp, arr, ndt, chunk):
+        """
+        write 1-dim array to a file in chunks
+         @param ofp: file object
+         @param arr: 1-dim numpy.ndarray
+         @param ndt: numpy.dtype of the elements in the file
+         @param chunk: number of elements per chunk
+        """
+        for s in range(0, arr.size, chunk):
+            ofp.write(numpy.ascontiguousarray(arr[s:s+chunk], dtype=ndt).data)
+        return
+
     def dataIndexed(self):
         """
         returns view of _data as multi-dim array
@@ -355,6 +594,25 @@ class SPH:
             return self._data.reshape([self._dims[2], self._dims[1], \
                                        self._dims[0], self._veclen])
 
+    def _calcMinMax(self):
+        """
+        calculate min/max of each vector component of _data
+        """
+        if self._data is None or self._data.size < 1:
+            self._min = [0.0] * self._veclen
+            self._max = [0.0] * self._veclen
+            return
+        arr = self._data
+        if arr.ndim == 1:
+            arr = arr.reshape((-1, self._veclen))
+        else:
+            # multi-dim view (e.g. a sub-block), reduce without flattening
+            arr = arr.reshape(arr.shape[:3] + (self._veclen,))
+        axis = tuple(range(arr.ndim - 1))
+        self._min = arr.min(axis=axis).tolist()
+        self._max = arr.max(axis=axis).tolist()
+        return
+
     def loadFromFort(self, path, dims, veclen=1, dtype=DT_SINGLE,
                      org=(0.0,0.0,0.0), pitch=(1.0,1.0,1.0),
                      tm=0.0, step=0, xcut=(0,0), ycut=(0,0), zcut=(0,0)):
@@ -382,7 +640,7 @@ class SPH:
         try:
             dimSz = dims[0] * dims[1] * dims[2] * veclen
         except:
-            print("SPH.loadFromFort: invalid dims or veclen specified.")
+            self._error("SPH.loadFromFort: invalid dims or veclen specified.")
             return False
         if dtype == SPH.DT_SINGLE:
             dsz = dimSz * 4
@@ -391,14 +649,14 @@ class SPH:
             dsz = dimSz * 8
             dds = "d"
         else:
-            print("SPH.loadFromFort: invalid dtype specified.")
+            self._error("SPH.loadFromFort: invalid dtype specified.")
             return False
 
         # open file
         try:
             ifp = open(path, "rb")
         except:
-            print("SPH.loadFromFort: open failed: %s" % path)
+            self._error("SPH.loadFromFort: open failed: %s" % path)
             return False
 
         # header
@@ -409,7 +667,7 @@ class SPH:
             bo = '>'
             buff = struct.unpack(bo+'i', header)
             if buff[0] != dsz:
-                print("SPH.loadFromFort: can not figure out byte-order"
+                self._error("SPH.loadFromFort: can not figure out byte-order"
                       + " or specified invalid dims.")
                 return False
 
@@ -418,13 +676,110 @@ class SPH:
         try:
             chunk = numpy.fromfile(ifp, dtype=ndt, count=1)
         except:
-            print("SPH.loadFromFort: data read failed: %s" % path)
+            self._error("SPH.loadFromFort: data read failed: %s" % path)
             ifp.close()
             return False
         ifp.close()
 
-        arr = chunk[0]["arr"].reshape((dims[2], dims[1], dims[0], veclen),
-                                      order='C')
+        arr = chunk[0]["arr"]
+        self._setupFromFort(arr, dims, veclen, dtype, org, pitch, tm, step,
+                            xcut, ycut, zcut)
+        # done
+        return True
+
+    def loadSubBoxFromFort(self, path, dims, veclen=1, dtype=DT_SINGLE,
+                           org=(0.0,0.0,0.0), pitch=(1.0,1.0,1.0),
+                           tm=0.0, step=0, xrange=None, yrange=None,
+                           zrange=None, stride=(1,1,1)):
+        """
+        load a sub-box of the grid from FORTRAN Unformatted file
+         @param path: file path to read
+         @param dims: data array size (X, Y, Z) of the whole record
+         @param veclen: vector length of each data(defalt=1)
+         @param dtype: data type(default=single precision)
+         @param org: corrdinate of the origin of the data(default=[0,0,0])
+         @param pitch: voxel pitch of each direction(default=[1,1,1])
+         @param tm: time of the data(default=0.0)
+         @param step: time step number of the data(default=0)
+         @param xrange: index range (start, stop) along X, stop is exclusive.
+                        None for the whole axis.
+         @param yrange: same as xrange along Y
+         @param zrange: same as xrange along Z
+         @param stride: index stride of each axis(default=(1,1,1))
+         @returns: True for succeed or False for failed.
+                   org, pitch and dims are adjusted to the sub-box.
+                   path is not set.
+        """
+        self._data = None
+        self._path = None
+
+        # check dims, dtype
+        try:
+            dimSz = dims[0] * dims[1] * dims[2] * veclen
+        except:
+            self._error("SPH.loadSubBoxFromFort: invalid dims or veclen specified.")
+            return False
+        if dtype == SPH.DT_SINGLE:
+            dds = "f4"
+        elif dtype == SPH.DT_DOUBLE:
+            dds = "f8"
+        else:
+            self._error("SPH.loadSubBoxFromFort: invalid dtype specified.")
+            return False
+        dsz = dimSz * int(dds[1])
+        rngs = SPH._subBoxRanges(dims, xrange, yrange, zrange, stride)
+        if rngs is None:
+            self._error("SPH.loadSubBoxFromFort: invalid range specified.")
+            return False
+
+        # open file
+        try:
+            ifp = open(path, "rb")
+        except:
+            self._error("SPH.loadSubBoxFromFort: open failed: %s" % path)
+            return False
+
+        # header
+        bo = '<'
+        header = ifp.read(4)
+        buff = struct.unpack(bo+'i', header)
+        if buff[0] != dsz:
+            bo = '>'
+            buff = struct.unpack(bo+'i', header)
+            if buff[0] != dsz:
+                self._error("SPH.loadSubBoxFromFort: can not figure out byte-order"
+                      + " or specified invalid dims.")
+                ifp.close()
+                return False
+
+        # read
+        try:
+            arr = SPH._readSubBox(ifp, 4, numpy.dtype(bo + dds), dims,
+                                  veclen, rngs)
+        except:
+            self._error("SPH.loadSubBoxFromFort: data read failed: %s" % path)
+            ifp.close()
+            return False
+        ifp.close()
+
+        # setup myself
+        self._veclen = veclen
+        self._org[:] = org[:]
+        self._pitch[:] = pitch[:]
+        self._dtype = dtype
+        self._time = tm
+        self._step = step
+        self._setSubBox(arr, rngs)
+        return True
+
+    def _setupFromFort(self, arr, dims, veclen, dtype, org, pitch, tm, step,
+                       xcut, ycut, zcut):
+        """
+        setup myself from the data record of FORTRAN Unformatted file
+         @param arr: 1-dim numpy.ndarray of the whole data record
+         @param others: same as loadFromFort
+        """
+        arr = arr.reshape((dims[2], dims[1], dims[0], veclen), order='C')
 
         # setup myself
         self._dims[:] = [dims[0]-xcut[0]-xcut[1],
@@ -441,20 +796,8 @@ class SPH:
         self._step = step
 
         # check min/max
-        self._min = [0.0]*veclen
-        self._max = [0.0]*veclen
-        for l in range(0, self._veclen):
-            self._min[l] = self._data[l]
-            self._max[l] = self._data[l]
-        for i in range(1, vdimSz):
-            for l in range(0, self._veclen):
-                val = self._data[i*self._veclen + l]
-                if self._min[l] > val:
-                    self._min[l] = val
-                elif self._max[l] < val:
-                    self._max[l] = val
-        # done
-        return True
+        self._calcMinMax()
+        return
 
     def saveToFort(self, path, dtype =None, endian='@'):
         """
@@ -464,6 +807,7 @@ class SPH:
          @param endian: BOM character according to 'struct' module
          @returns: True for succeed or False for failed.
         """
+        if self._data is None: return False
         xtype = dtype
         if xtype is None: xtype = self._dtype
         if xtype is None: return False
@@ -472,33 +816,19 @@ class SPH:
         try:
             ofp = open(path, "wb")
         except:
-            print("SPH.saveToFort: open failed: %s" % path)
+            self._error("SPH.saveToFort: open failed: %s" % path)
             return False
-        
+
         # data record
         dimSz = self._dims[0] * self._dims[1] * self._dims[2]
-        dimVX = self._veclen * self._dims[0]
-        k = 0
+        bo = {'@': '=', '!': '>'}.get(endian, endian)
         if xtype == SPH.DT_DOUBLE:
-            dfmt = endian + '%dd' % dimVX
-            ofp.write(struct.pack(endian+'i', dimSz*self._veclen*8))
-            for i in range(self._dims[2]):
-                for j in range(self._dims[1]):
-                    ofp.write(struct.pack(dfmt, *self._data[k:k+dimVX]))
-                    k = k + dimVX
-                    continue # end of for(j)
-                continue # end of for(i)
-            ofp.write(struct.pack(endian+'i', dimSz*self._veclen*8))
+            ndt = numpy.dtype(bo + 'f8')
         else:
-            dfmt = '%df' % dimVX
-            ofp.write(struct.pack(endian+'i', dimSz*self._veclen*4))
-            for i in range(self._dims[2]):
-                for j in range(self._dims[1]):
-                    ofp.write(struct.pack(dfmt, *self._data[k:k+dimVX]))
-                    k = k + dimVX
-                    continue # end of for(j)
-                continue # end of for(i)
-            ofp.write(struct.pack(endian+'i', dimSz*self._veclen*4))
+            ndt = numpy.dtype(bo + 'f4')
+        ofp.write(struct.pack(endian+'i', dimSz*self._veclen*ndt.itemsize))
+        self._writeData(ofp, ndt)
+        ofp.write(struct.pack(endian+'i', dimSz*self._veclen*ndt.itemsize))
 
         ofp.close()
         return True
@@ -526,3 +856,352 @@ class SPH:
         self._min[0] = self._data.min()
         self._max[0] = self._data.max()
         return True
+
+    async def _readAsync(self, ifp, ndt, count, executor):
+        """
+        read count elements from ifp in chunks of IO_CHUNK bytes,
+        each chunk is read in executor
+         @returns: numpy.ndarray of dtype ndt, or None for short read
+        """
+        loop = asyncio.get_running_loop()
+        arr = numpy.empty(count, dtype=ndt)
+        buf = memoryview(arr.view(numpy.uint8))
+        for s in range(0, len(buf), SPH.IO_CHUNK):
+            mv = buf[s:s+SPH.IO_CHUNK]
+            nr = await loop.run_in_executor(executor, ifp.readinto, mv)
+            if nr != len(mv):
+                return None
+        return arr
+
+    async def _writeDataAsync(self, ofp, ndt, executor):
+        """
+        awaitable counterpart of _writeData, each chunk is converted and
+        written in executor
+        """
+        loop = asyncio.get_running_loop()
+        chunk = max(1, SPH.IO_CHUNK // ndt.itemsize)
+        for piece in self._dataPieces():
+            for s in range(0, piece.size, chunk):
+                await loop.run_in_executor(executor, SPH._writeArray, ofp,
+                                           piece[s:s+chunk], ndt, chunk)
+        return
+
+    async def loadAsync(self, path, executor=None):
+        """
+        awaitable counterpart of load. blocking file operations are done
+        in executor and the data record is read in chunks of IO_CHUNK bytes.
+         @param path: file path of the .sph file
+         @param executor: concurrent.futures.Executor to run blocking
+                          operations. if None, the loop's default executor
+         @returns: True for succeed or False for failed.
+        """
+        self._data = None
+        self._path = None
+        loop = asyncio.get_running_loop()
+
+        # open file
+        try:
+            ifp = await loop.run_in_executor(executor, open, path, "rb")
+        except:
+            self._error("SPH.loadAsync: open failed: %s" % path)
+            return False
+
+        # header records
+        try:
+            bo = await loop.run_in_executor(executor, self._readHeader, ifp)
+        except:
+            bo = None
+        if bo is None:
+            self._error("SPH.loadAsync: invalid header: %s" % path)
+            ifp.close()
+            return False
+
+        # data record
+        dimSz = self._dims[0] * self._dims[1] * self._dims[2]
+        if self._dtype == SPH.DT_SINGLE:
+            ndt = numpy.dtype(bo + 'f4')
+        else:
+            ndt = numpy.dtype(bo + 'f8')
+        try:
+            arr = await self._readAsync(ifp, ndt, dimSz*self._veclen,
+                                        executor)
+        except:
+            arr = None
+        ifp.close()
+        if arr is None:
+            self._error("SPH.loadAsync: data read failed: %s" % path)
+            return False
+        self._data = await loop.run_in_executor(
+            executor, functools.partial(arr.astype, ndt.newbyteorder('='),
+                                        copy=False))
+        await loop.run_in_executor(executor, self._calcMinMax)
+
+        # done
+        self._path = path
+        return True
+
+    async def saveAsync(self, path =None, dtype =None, executor=None):
+        """
+        awaitable counterpart of save. blocking file operations are done
+        in executor and the data record is written in chunks of IO_CHUNK
+        bytes.
+         @param path: file path of the .sph file. if None, use self._path
+         @param dtype: file dtype of the .sph file. if None, use self._dtype
+         @param executor: concurrent.futures.Executor to run blocking
+                          operations. if None, the loop's default executor
+         @returns: True for succeed or False for failed.
+        """
+        if self._data is None: return False
+        xpath = path
+        if xpath is None: xpath = self._path
+        if xpath is None: return False
+        xtype = dtype
+        if xtype is None: xtype = self._dtype
+        if xtype is None: return False
+        loop = asyncio.get_running_loop()
+
+        # open output file
+        try:
+            ofp = await loop.run_in_executor(executor, open, xpath, "wb")
+        except:
+            self._error("SPH.saveAsync: open failed: %s" % xpath)
+            return False
+        self._dtype = xtype
+
+        # header records
+        await loop.run_in_executor(executor, self._writeHeader, ofp)
+
+        # data record
+        dimSz = self._dims[0] * self._dims[1] * self._dims[2]
+        if self._dtype == SPH.DT_DOUBLE:
+            ndt = numpy.dtype('=f8')
+        else:
+            ndt = numpy.dtype('=f4')
+        rsz = struct.pack('i', dimSz*self._veclen*ndt.itemsize)
+        await loop.run_in_executor(executor, ofp.write, rsz)
+        await self._writeDataAsync(ofp, ndt, executor)
+        await loop.run_in_executor(executor, ofp.write, rsz)
+
+        await loop.run_in_executor(executor, ofp.close)
+        self._path = xpath
+        return True
+
+    async def loadFromFortAsync(self, path, dims, veclen=1, dtype=DT_SINGLE,
+                                org=(0.0,0.0,0.0), pitch=(1.0,1.0,1.0),
+                                tm=0.0, step=0, xcut=(0,0), ycut=(0,0),
+                                zcut=(0,0), executor=None):
+        """
+        awaitable counterpart of loadFromFort. blocking file operations are
+        done in executor and the data record is read in chunks of IO_CHUNK
+        bytes.
+         @param executor: concurrent.futures.Executor to run blocking
+                          operations. if None, the loop's default executor
+         @param others: same as loadFromFort
+         @returns: True for succeed or False for failed.
+        """
+        self._data = None
+        self._path = None
+        loop = asyncio.get_running_loop()
+
+        # check dims, dtype
+        try:
+            dimSz = dims[0] * dims[1] * dims[2] * veclen
+        except:
+            self._error("SPH.loadFromFortAsync: invalid dims or veclen specified.")
+            return False
+        if dtype == SPH.DT_SINGLE:
+            dds = "f4"
+        elif dtype == SPH.DT_DOUBLE:
+            dds = "f8"
+        else:
+            self._error("SPH.loadFromFortAsync: invalid dtype specified.")
+            return False
+        dsz = dimSz * int(dds[1])
+
+        # open file
+        try:
+            ifp = await loop.run_in_executor(executor, open, path, "rb")
+        except:
+            self._error("SPH.loadFromFortAsync: open failed: %s" % path)
+            return False
+
+        # header
+        header = await loop.run_in_executor(executor, ifp.read, 4)
+        bo = None
+        if len(header) == 4:
+            for xbo in ('<', '>'):
+                if struct.unpack(xbo+'i', header)[0] == dsz:
+                    bo = xbo
+                    break
+        if bo is None:
+            self._error("SPH.loadFromFortAsync: can not figure out byte-order"
+                  + " or specified invalid dims.")
+            ifp.close()
+            return False
+
+        # read
+        try:
+            arr = await self._readAsync(ifp, numpy.dtype(bo + dds), dimSz,
+                                        executor)
+        except:
+            arr = None
+        ifp.close()
+        if arr is None:
+            self._error("SPH.loadFromFortAsync: data read failed: %s" % path)
+            return False
+
+        await loop.run_in_executor(
+            executor, self._setupFromFort, arr, dims, veclen, dtype, org,
+            pitch, tm, step, xcut, ycut, zcut)
+        # done
+        return True
+
+    async def saveToFortAsync(self, path, dtype =None, endian='@',
+                              executor=None):
+        """
+        awaitable counterpart of saveToFort. blocking file operations are
+        done in executor and the data record is written in chunks of
+        IO_CHUNK bytes.
+         @param path: file path to write
+         @param dtype: file dtype of the .sph file. if None, use self._dtype
+         @param endian: BOM character according to 'struct' module
+         @param executor: concurrent.futures.Executor to run blocking
+                          operations. if None, the loop's default executor
+         @returns: True for succeed or False for failed.
+        """
+        if self._data is None: return False
+        xtype = dtype
+        if xtype is None: xtype = self._dtype
+        if xtype is None: return False
+        loop = asyncio.get_running_loop()
+
+        # open output file
+        try:
+            ofp = await loop.run_in_executor(executor, open, path, "wb")
+        except:
+            self._error("SPH.saveToFortAsync: open failed: %s" % path)
+            return False
+
+        # data record
+        dimSz = self._dims[0] * self._dims[1] * self._dims[2]
+        bo = {'@': '=', '!': '>'}.get(endian, endian)
+        if xtype == SPH.DT_DOUBLE:
+            ndt = numpy.dtype(bo + 'f8')
+        else:
+            ndt = numpy.dtype(bo + 'f4')
+        rsz = struct.pack(endian+'i', dimSz*self._veclen*ndt.itemsize)
+        await loop.run_in_executor(executor, ofp.write, rsz)
+        await self._writeDataAsync(ofp, ndt, executor)
+        await loop.run_in_executor(executor, ofp.write, rsz)
+
+        await loop.run_in_executor(executor, ofp.close)
+        return True
+
+    @staticmethod
+    def loadMany(paths, workers=None, process=False, fort=None):
+        """
+        load many .sph (or FORTRAN Unformatted) files concurrently
+         @param paths: list of file paths
+         @param workers: number of workers(default=os.cpu_count())
+         @param process: use a process pool instead of a thread pool
+                         (default=False). threads are enough for plain
+                         loading because file reads and numpy conversions
+                         release the GIL.
+         @param fort: dict of keyword arguments of loadFromFort (dims,
+                      veclen, dtype, ...) to load FORTRAN Unformatted files.
+                      if None, load .sph files.
+         @returns: (list of SPH, list of error message), both in the order
+                   of paths. SPH is None and the message is set for the
+                   failed files, message is None for the succeeded files.
+        """
+        return SPH._runMany(_loadOne, [(p, fort) for p in paths],
+                            workers, process)
+
+    @staticmethod
+    def saveMany(sphs, paths, workers=None, process=False, dtype=None,
+                 fort=False, endian='@'):
+        """
+        save many SPH objects concurrently
+         @param sphs: list of SPH
+         @param paths: list of file paths, same length as sphs
+         @param workers: number of workers(default=os.cpu_count())
+         @param process: use a process pool instead of a thread pool
+                         (default=False)
+         @param dtype: file dtype. if None, use dtype of each SPH
+         @param fort: save as FORTRAN Unformatted files(default=False)
+         @param endian: BOM character for FORTRAN Unformatted files
+         @returns: list of error message in the order of paths,
+                   None for the succeeded files.
+        """
+        if len(sphs) != len(paths):
+            raise ValueError('SPH.saveMany: length of sphs and paths differ')
+        _, errs = SPH._runMany(_saveOne,
+                               [(d, p, dtype, fort, endian)
+                                for d, p in zip(sphs, paths)],
+                               workers, process)
+        return errs
+
+    @staticmethod
+    def _runMany(func, args, workers, process):
+        """
+        run func(*arg) for each arg in a worker pool
+         @returns: (list of result, list of error message) in input order
+        """
+        if workers is None: workers = os.cpu_count() or 1
+        workers = max(1, min(workers, len(args)))
+        if workers == 1:
+            res = [func(*a) for a in args]
+        else:
+            Executor = ProcessPoolExecutor if process else ThreadPoolExecutor
+            with Executor(max_workers=workers) as ex:
+                futs = [ex.submit(func, *a) for a in args]
+                res = []
+                for f in futs:
+                    try:
+                        res.append(f.result())
+                    except Exception as e:
+                        res.append((None, '%s: %s' % (type(e).__name__, e)))
+        return ([r[0] for r in res], [r[1] for r in res])
+
+
+def _loadOne(path, fort):
+    """
+    worker of SPH.loadMany
+     @returns: (SPH or None, error message or None)
+    """
+    sph = SPH()
+    sph._quiet = True
+    try:
+        if fort is None:
+            ok = sph.load(path)
+        else:
+            ok = sph.loadFromFort(path, **fort)
+    except Exception as e:
+        return (None, '%s: %s: %s' % (path, type(e).__name__, e))
+    sph._quiet = False
+    if not ok:
+        return (None, sph._lastError or '%s: load failed' % path)
+    return (sph, None)
+
+def _saveOne(sph, path, dtype, fort, endian):
+    """
+    worker of SPH.saveMany
+     @returns: (None, error message or None)
+    """
+    if sph is None or sph._data is None:
+        return (None, '%s: save failed: no data' % path)
+    quiet = sph._quiet
+    sph._quiet = True
+    sph._lastError = None
+    try:
+        if fort:
+            ok = sph.saveToFort(path, dtype=dtype, endian=endian)
+        else:
+            ok = sph.save(path, dtype=dtype)
+    except Exception as e:
+        return (None, '%s: %s: %s' % (path, type(e).__name__, e))
+    finally:
+        sph._quiet = quiet
+    if not ok:
+        return (None, sph._lastError or '%s: save failed' % path)
+    return (None, None)
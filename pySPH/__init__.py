@@ -1 +1 @@
-__all__ = ["SPH", "filter", "isosurf" ]
+__all__ = ["SPH", "filter", "isosurf", "catalog", "series", "stats", "chunked", "lod" ]
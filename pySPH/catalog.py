@@ -0,0 +1,245 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+catalog index of .sph files for Sphere framework
+"""
+from __future__ import print_function
+import os
+import glob
+import numpy
+from . import SPH
+
+
+class SPHCatalog:
+    """
+    Header-only index of .sph files in a directory
+    """
+
+    """ default file name of the catalog index """
+    INDEX_NAME = '.sphcatalog.npz'
+
+    def __init__(self):
+        """
+        class initializer
+        """
+        self.reset()
+        return
+
+    def reset(self):
+        """
+        clear the index
+        """
+        self._root = None
+        self._entries = SPHCatalog._makeEntries(0, 1)
+        return
+
+    @staticmethod
+    def _makeEntries(n, pathlen):
+        """
+        allocate entry array
+         @param n: number of entries
+         @param pathlen: max length of path strings
+         @returns: numpy structured array
+        """
+        ndt = numpy.dtype([('path', 'U%d' % max(pathlen, 1)),
+                           ('dims', 'i8', (3,)),
+                           ('org', 'f8', (3,)),
+                           ('pitch', 'f8', (3,)),
+                           ('step', 'i8'),
+                           ('time', 'f8'),
+                           ('veclen', 'i4'),
+                           ('dtype', 'i4'),
+                           ('offset', 'i8'),
+                           ('endian', 'U1'),
+                           ('size', 'i8'),
+                           ('mtime', 'f8')])
+        return numpy.zeros(n, dtype=ndt)
+
+    @property
+    def root(self):
+        return self._root
+
+    @property
+    def entries(self):
+        return self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def probe(path):
+        """
+        read header records of a .sph file
+         @param path: file path of the .sph file
+         @returns: dict of header fields, or None for failed.
+        """
+        sph = SPH.SPH()
+        try:
+            ifp = open(path, "rb")
+        except:
+            return None
+        try:
+            bo = sph._readHeader(ifp)
+            offset = ifp.tell()
+        except:
+            bo = None
+        ifp.close()
+        if bo is None:
+            return None
+        st = os.stat(path)
+        return {'dims': list(sph._dims), 'org': list(sph._org),
+                'pitch': list(sph._pitch), 'step': sph._step,
+                'time': sph._time, 'veclen': sph._veclen,
+                'dtype': sph._dtype, 'offset': offset, 'endian': bo,
+                'size': st.st_size, 'mtime': st.st_mtime}
+
+    def build(self, root, pattern='*.sph', recursive=False, reuse=True):
+        """
+        scan .sph files under root and build the index
+         @param root: directory to scan
+         @param pattern: glob pattern of file names(default='*.sph')
+         @param recursive: scan sub-directories too(default=False)
+         @param reuse: reuse entries of the current index whose file size
+                       and mtime are unchanged(default=True)
+         @returns: number of files indexed
+        """
+        if recursive:
+            paths = glob.glob(os.path.join(root, '**', pattern),
+                              recursive=True)
+        else:
+            paths = glob.glob(os.path.join(root, pattern))
+        paths = sorted(os.path.relpath(p, root) for p in paths)
+
+        known = {}
+        if reuse and self._root is not None \
+           and os.path.abspath(self._root) == os.path.abspath(root):
+            for e in self._entries:
+                known[str(e['path'])] = e
+
+        recs = []
+        for p in paths:
+            full = os.path.join(root, p)
+            e = known.get(p)
+            if e is not None:
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                if st.st_size == e['size'] and st.st_mtime == e['mtime']:
+                    recs.append((p, e))
+                    continue
+            hdr = SPHCatalog.probe(full)
+            if hdr is None:
+                print("SPHCatalog.build: skip invalid file: %s" % full)
+                continue
+            recs.append((p, hdr))
+            continue # end of for(p)
+
+        ent = SPHCatalog._makeEntries(len(recs),
+                                      max([len(p) for p, _ in recs] + [1]))
+        for i, (p, hdr) in enumerate(recs):
+            ent[i]['path'] = p
+            for key in ent.dtype.names[1:]:
+                ent[i][key] = hdr[key]
+            continue # end of for(i)
+        self._entries = ent[numpy.lexsort((ent['time'], ent['step']))]
+        self._root = root
+        return len(self._entries)
+
+    def save(self, path=None):
+        """
+        save the index to a file
+         @param path: index file path. if None, INDEX_NAME under the root
+         @returns: True for succeed or False for failed.
+        """
+        if self._root is None: return False
+        xpath = path
+        if xpath is None:
+            xpath = os.path.join(self._root, SPHCatalog.INDEX_NAME)
+        try:
+            with open(xpath, 'wb') as ofp:
+                numpy.savez(ofp, root=numpy.array(self._root),
+                            entries=self._entries)
+        except:
+            print("SPHCatalog.save: write failed: %s" % xpath)
+            return False
+        return True
+
+    def load(self, path):
+        """
+        load the index from a file
+         @param path: index file path, or directory containing INDEX_NAME
+         @returns: True for succeed or False for failed.
+        """
+        xpath = path
+        if os.path.isdir(xpath):
+            xpath = os.path.join(xpath, SPHCatalog.INDEX_NAME)
+        try:
+            with numpy.load(xpath, allow_pickle=False) as npz:
+                self._root = str(npz['root'])
+                self._entries = npz['entries']
+        except:
+            print("SPHCatalog.load: read failed: %s" % xpath)
+            self.reset()
+            return False
+        return True
+
+    def fullPath(self, idx):
+        """
+        full path of the idx-th entry
+         @param idx: entry index
+         @returns: file path
+        """
+        return os.path.join(self._root, str(self._entries[idx]['path']))
+
+    def findStep(self, smin, smax):
+        """
+        find files whose step is in [smin, smax]
+         @param smin: lower bound of step
+         @param smax: upper bound of step
+         @returns: list of file paths in step order
+        """
+        ent = self._entries
+        idx = numpy.nonzero((ent['step'] >= smin) & (ent['step'] <= smax))[0]
+        return [self.fullPath(i) for i in idx]
+
+    def findTime(self, tmin, tmax):
+        """
+        find files whose time is in [tmin, tmax]
+         @param tmin: lower bound of time
+         @param tmax: upper bound of time
+         @returns: list of file paths in step order
+        """
+        ent = self._entries
+        idx = numpy.nonzero((ent['time'] >= tmin) & (ent['time'] <= tmax))[0]
+        return [self.fullPath(i) for i in idx]
+
+    def nearestTime(self, t):
+        """
+        find the file whose time is nearest to t
+         @param t: time
+         @returns: file path, or None if the catalog is empty
+        """
+        if len(self._entries) < 1: return None
+        i = int(numpy.argmin(numpy.abs(self._entries['time'] - t)))
+        return self.fullPath(i)
+
+    def header(self, idx):
+        """
+        SPH object holding header fields of the idx-th entry (no data)
+         @param idx: entry index
+         @returns: SPH.SPH
+        """
+        e = self._entries[idx]
+        sph = SPH.SPH()
+        sph._dims[:] = e['dims'].tolist()
+        sph._org[:] = e['org'].tolist()
+        sph._pitch[:] = e['pitch'].tolist()
+        sph._step = int(e['step'])
+        sph._time = float(e['time'])
+        sph._veclen = int(e['veclen'])
+        sph._dtype = int(e['dtype'])
+        sph._min = [0.0] * sph._veclen
+        sph._max = [0.0] * sph._veclen
+        sph._path = self.fullPath(idx)
+        return sph
@@ -0,0 +1,376 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+chunked and compressed container of SPH data
+"""
+from __future__ import print_function
+import os
+import struct
+import zlib
+import lzma
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+from . import SPH
+
+
+class SPHChunked:
+    """
+    Container file (.sphc) storing the SPH header and the grid split into
+    fixed size 3D chunks, each compressed independently.
+
+    layout (little endian):
+      header (_HEADER), chunk offset table (uint64 x (nchunk+1)),
+      compressed chunks in (cz, cy, cx) order.
+    each chunk holds the (z, y, x, veclen) C-order sub-array of the grid,
+    byte-shuffled (all 1st bytes, all 2nd bytes, ...) if shuffle is on.
+    """
+
+    """ file extension """
+    EXT = '.sphc'
+
+    """ codec identifiers """
+    (CODEC_NONE, CODEC_ZLIB, CODEC_LZMA) = (0, 1, 2)
+    CODECS = {'none': CODEC_NONE, 'zlib': CODEC_ZLIB, 'lzma': CODEC_LZMA}
+
+    _MAGIC = b'SPHC'
+    _VERSION = 1
+    _HEADER = struct.Struct('<4sHBBII3I3Iqd3d3dQ')
+
+    def __init__(self):
+        """
+        class initializer
+        """
+        self._fp = None
+        self._path = None
+        self._sph = None
+        self._chunk = [0, 0, 0]
+        self._nchunk = [0, 0, 0]
+        self._codec = SPHChunked.CODEC_NONE
+        self._shuffle = False
+        self._offsets = None
+        return
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def header(self):
+        """ SPH.SPH holding the header of the file (no data) """
+        return self._sph
+
+    @property
+    def chunk(self):
+        return self._chunk
+
+    @property
+    def nchunk(self):
+        """ number of chunks along each axis (X, Y, Z) """
+        return self._nchunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        close the file
+        """
+        if self._fp is not None:
+            self._fp.close()
+        self._fp = None
+        return
+
+    @staticmethod
+    def _ndtype(dtype):
+        if dtype == SPH.SPH.DT_DOUBLE:
+            return numpy.dtype('<f8')
+        return numpy.dtype('<f4')
+
+    @staticmethod
+    def _encode(arr, codec, level, shuffle):
+        """
+        compress a chunk
+         @param arr: contiguous little-endian chunk array
+         @returns: bytes
+        """
+        raw = arr.view(numpy.uint8).reshape((-1, arr.itemsize))
+        if shuffle:
+            raw = numpy.ascontiguousarray(raw.T)
+        if codec == SPHChunked.CODEC_ZLIB:
+            return zlib.compress(memoryview(raw).cast('B'), level)
+        if codec == SPHChunked.CODEC_LZMA:
+            return lzma.compress(memoryview(raw).cast('B'), preset=level)
+        return raw.tobytes()
+
+    @staticmethod
+    def _decode(buf, codec, shuffle, ndt, shape):
+        """
+        decompress a chunk
+         @returns: numpy.ndarray of shape
+        """
+        if codec == SPHChunked.CODEC_ZLIB:
+            buf = zlib.decompress(buf)
+        elif codec == SPHChunked.CODEC_LZMA:
+            buf = lzma.decompress(buf)
+        raw = numpy.frombuffer(buf, dtype=numpy.uint8)
+        if shuffle:
+            raw = raw.reshape((ndt.itemsize, -1)).T.copy()
+        return raw.view(ndt).reshape(shape)
+
+    @staticmethod
+    def save(sph, path, chunk=(64, 64, 64), codec='zlib', level=6,
+             shuffle=True, workers=None):
+        """
+        save SPH data to chunked container file
+         @param sph: SPH.SPH (the data may be memory-mapped)
+         @param path: file path
+         @param chunk: chunk size (X, Y, Z)(default=(64,64,64))
+         @param codec: 'zlib', 'lzma' or 'none'(default='zlib')
+         @param level: compression level(default=6)
+         @param shuffle: byte-shuffle before compression(default=True)
+         @param workers: number of compression threads
+                         (default=None: os.cpu_count())
+         @returns: True for succeed or False for failed.
+        """
+        if sph is None or sph._data is None:
+            return False
+        if codec not in SPHChunked.CODECS:
+            print("SPHChunked.save: unknown codec: %s" % codec)
+            return False
+        cdc = SPHChunked.CODECS[codec]
+        dims = sph._dims
+        chunk = [max(1, min(int(chunk[a]), dims[a])) for a in range(3)]
+        nch = [(dims[a] + chunk[a] - 1) // chunk[a] for a in range(3)]
+        ntot = nch[0] * nch[1] * nch[2]
+        ndt = SPHChunked._ndtype(sph._dtype)
+        vol = sph._data.reshape((dims[2], dims[1], dims[0], sph._veclen))
+        if workers is None: workers = os.cpu_count() or 1
+
+        def encodeOne(ci, cj, ck):
+            sub = vol[ck*chunk[2]:(ck+1)*chunk[2],
+                      cj*chunk[1]:(cj+1)*chunk[1],
+                      ci*chunk[0]:(ci+1)*chunk[0]]
+            sub = numpy.ascontiguousarray(sub, dtype=ndt)
+            return SPHChunked._encode(sub, cdc, level, shuffle)
+
+        try:
+            ofp = open(path, 'wb')
+        except:
+            print("SPHChunked.save: open failed: %s" % path)
+            return False
+        try:
+            hdr = SPHChunked._HEADER.pack(
+                SPHChunked._MAGIC, SPHChunked._VERSION, cdc,
+                1 if shuffle else 0, sph._dtype, sph._veclen,
+                dims[0], dims[1], dims[2], chunk[0], chunk[1], chunk[2],
+                sph._step, sph._time,
+                sph._org[0], sph._org[1], sph._org[2],
+                sph._pitch[0], sph._pitch[1], sph._pitch[2], ntot)
+            ofp.write(hdr)
+            tblPos = ofp.tell()
+            offsets = numpy.zeros(ntot + 1, dtype='<u8')
+            ofp.write(offsets.tobytes())  # reserved, rewritten at the end
+            pos = ofp.tell()
+            n = 0
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+                # compress one slab of chunks at a time to bound memory
+                for ck in range(nch[2]):
+                    idx = [(ci, cj, ck) for cj in range(nch[1])
+                           for ci in range(nch[0])]
+                    for buf in ex.map(lambda c: encodeOne(*c), idx):
+                        offsets[n] = pos
+                        ofp.write(buf)
+                        pos += len(buf)
+                        n += 1
+                    continue # end of for(ck)
+            offsets[n] = pos
+            ofp.seek(tblPos)
+            ofp.write(offsets.tobytes())
+        except Exception as e:
+            print("SPHChunked.save: write failed: %s: %s" % (path, e))
+            ofp.close()
+            return False
+        ofp.close()
+        return True
+
+    @staticmethod
+    def convert(srcPath, dstPath, **kwargs):
+        """
+        convert .sph file to chunked container file through a memory map
+         @param srcPath: file path of the .sph file
+         @param dstPath: file path of the container file
+         @param kwargs: keyword arguments of save()
+         @returns: True for succeed or False for failed.
+        """
+        sph = SPH.SPH()
+        if not sph.load(srcPath, mmap=True):
+            return False
+        return SPHChunked.save(sph, dstPath, **kwargs)
+
+    @staticmethod
+    def open(path):
+        """
+        open chunked container file and read its header and offset table
+         @param path: file path
+         @returns: SPHChunked, or None for failed.
+        """
+        try:
+            ifp = open(path, 'rb')
+        except:
+            print("SPHChunked.open: open failed: %s" % path)
+            return None
+        try:
+            (magic, ver, cdc, shf, dtype, veclen, nx, ny, nz, cx, cy, cz,
+             step, tm, ox, oy, oz, px, py, pz, ntot) = \
+                SPHChunked._HEADER.unpack(ifp.read(SPHChunked._HEADER.size))
+            if magic != SPHChunked._MAGIC or ver > SPHChunked._VERSION:
+                raise ValueError('bad magic or version')
+            offsets = numpy.frombuffer(ifp.read(8 * (ntot + 1)),
+                                       dtype='<u8')
+            if offsets.size != ntot + 1:
+                raise ValueError('truncated offset table')
+        except Exception as e:
+            print("SPHChunked.open: invalid file: %s: %s" % (path, e))
+            ifp.close()
+            return None
+
+        cf = SPHChunked()
+        cf._fp = ifp
+        cf._path = path
+        cf._codec = cdc
+        cf._shuffle = (shf != 0)
+        cf._chunk = [cx, cy, cz]
+        cf._nchunk = [(nx + cx - 1) // cx, (ny + cy - 1) // cy,
+                      (nz + cz - 1) // cz]
+        cf._offsets = offsets
+        sph = SPH.SPH()
+        sph._dims = [nx, ny, nz]
+        sph._org = [ox, oy, oz]
+        sph._pitch = [px, py, pz]
+        sph._dtype = dtype
+        sph._veclen = veclen
+        sph._step = step
+        sph._time = tm
+        sph._min = None
+        sph._max = None
+        sph._path = path
+        cf._sph = sph
+        return cf
+
+    def readChunk(self, ci, cj, ck):
+        """
+        read and decompress one chunk
+         @param ci, cj, ck: chunk index along X, Y, Z
+         @returns: numpy.ndarray of shape (z, y, x, veclen)
+        """
+        n = (ck * self._nchunk[1] + cj) * self._nchunk[0] + ci
+        self._fp.seek(int(self._offsets[n]))
+        buf = self._fp.read(int(self._offsets[n+1] - self._offsets[n]))
+        return self._decodeChunk(buf, ci, cj, ck)
+
+    def _decodeChunk(self, buf, ci, cj, ck):
+        """
+        decompress chunk (ci, cj, ck) read from the file
+        """
+        dims = self._sph._dims
+        c = self._chunk
+        shape = (min(c[2], dims[2] - ck*c[2]), min(c[1], dims[1] - cj*c[1]),
+                 min(c[0], dims[0] - ci*c[0]), self._sph._veclen)
+        return SPHChunked._decode(buf, self._codec, self._shuffle,
+                                  SPHChunked._ndtype(self._sph._dtype),
+                                  shape)
+
+    def read(self, xrange=None, yrange=None, zrange=None, stride=(1,1,1),
+             workers=1):
+        """
+        read a sub-box of the grid, decompressing only the chunks touched
+         @param xrange: index range (start, stop) along X, stop is exclusive.
+                        None for the whole axis.
+         @param yrange: same as xrange along Y
+         @param zrange: same as xrange along Z
+         @param stride: index stride of each axis(default=(1,1,1))
+         @param workers: number of decompression threads(default=1)
+         @returns: SPH.SPH, or None for failed.
+                   org, pitch and dims are adjusted to the sub-box.
+                   path is not set, so that save() without a path does not
+                   write .sph data over the container file.
+        """
+        if self._fp is None: return None
+        hd = self._sph
+        rngs = SPH.SPH._subBoxRanges(hd._dims, xrange, yrange, zrange,
+                                     stride)
+        if rngs is None:
+            print("SPHChunked.read: invalid range specified.")
+            return None
+        ndt = SPHChunked._ndtype(hd._dtype).newbyteorder('=')
+        out = numpy.empty((len(rngs[2]), len(rngs[1]), len(rngs[0]),
+                           hd._veclen), dtype=ndt)
+
+        # per axis: (chunk index, output slice, local slice in the chunk)
+        axes = []
+        for a in range(3):
+            r = rngs[a]
+            c = self._chunk[a]
+            lst = []
+            for ci in range(r[0] // c, r[-1] // c + 1):
+                c0 = ci * c
+                o0 = max(0, -(-(c0 - r[0]) // r.step))
+                o1 = min(len(r), -(-(c0 + c - r[0]) // r.step))
+                if o0 >= o1:
+                    continue
+                lst.append((ci, slice(o0, o1),
+                            slice(r[o0] - c0, r[o1-1] - c0 + 1, r.step)))
+            axes.append(lst)
+
+        def place(job):
+            (zi, zo, zl), (yi, yo, yl), (xi, xo, xl), buf = job
+            arr = self._decodeChunk(buf, xi, yi, zi)
+            out[zo, yo, xo] = arr[zl, yl, xl]
+            return
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+                for az in axes[2]:
+                    jobs = []
+                    for ay in axes[1]:
+                        for ax in axes[0]:
+                            n = (az[0] * self._nchunk[1] + ay[0]) \
+                                * self._nchunk[0] + ax[0]
+                            self._fp.seek(int(self._offsets[n]))
+                            buf = self._fp.read(int(self._offsets[n+1]
+                                                    - self._offsets[n]))
+                            jobs.append((az, ay, ax, buf))
+                    list(ex.map(place, jobs))
+                    continue # end of for(az)
+        except Exception as e:
+            print("SPHChunked.read: read failed: %s: %s" % (self._path, e))
+            return None
+
+        sph = SPH.SPH()
+        sph._dims = list(hd._dims)
+        sph._org = list(hd._org)
+        sph._pitch = list(hd._pitch)
+        sph._dtype = hd._dtype
+        sph._veclen = hd._veclen
+        sph._step = hd._step
+        sph._time = hd._time
+        sph._setSubBox(out, rngs)
+        return sph
+
+    @staticmethod
+    def load(path, xrange=None, yrange=None, zrange=None, stride=(1,1,1),
+             workers=1):
+        """
+        load the whole grid or a sub-box from chunked container file
+         @param path: file path
+         @param xrange, yrange, zrange, stride, workers: see read()
+         @returns: SPH.SPH, or None for failed.
+        """
+        cf = SPHChunked.open(path)
+        if cf is None: return None
+        with cf:
+            return cf.read(xrange, yrange, zrange, stride, workers)
@@ -5,7 +5,9 @@ SPH divide filter
 """
 
 import sys, os
+import struct
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from .. import SPH
 
 def divideShareEdge(d: SPH.SPH, div: []) -> []:
@@ -62,8 +64,8 @@ def divideShareEdge(d: SPH.SPH, div: []) -> []:
                 sph._step = d._step
                 sph._time = d._time
                 sph._dtype = d._dtype
-                sph._min = list(d._min)
-                sph._max = list(d._max)
+                sph._min = list(d.min)
+                sph._max = list(d.max)
                 if d._dtype == SPH.SPH.DT_DOUBLE:
                     sph._data = np.array(0, dtype=np.float64)
                 else:
@@ -71,21 +73,13 @@ def divideShareEdge(d: SPH.SPH, div: []) -> []:
                 dimSz = sph._dims[0]*sph._dims[1]*sph._dims[2]*d._veclen
                 sph._data.resize(dimSz)
 
+                # index through dataIndexed(), d may be a block view
+                src = d.dataIndexed()
+                dst = sph.dataIndexed()
                 for kk in range(newDims[2]):
-                    for jj in range(newDims[1]):
-                        sst_idx = d._dims[0]*d._dims[1]*(kk+newOrgIdx[2]) \
-                            + d._dims[0]*(jj+newOrgIdx[1]) + newOrgIdx[0]
-                        sst_idx = sst_idx * d._veclen
-                        sed_idx = sst_idx + newDims[0] * d._veclen
-
-                        dst_idx = sph._dims[0]*sph._dims[1]*kk \
-                                  + sph._dims[0]*jj
-                        dst_idx = dst_idx * d._veclen
-                        ded_idx = dst_idx + newDims[0] * d._veclen
-
-                        sph._data[dst_idx:ded_idx] \
-                            = d._data[sst_idx:sed_idx]
-                        continue # jj
+                    dst[kk] = src[kk+newOrgIdx[2],
+                                  newOrgIdx[1]:newOrgIdx[1]+newDims[1],
+                                  newOrgIdx[0]:newOrgIdx[0]+newDims[0]]
                     continue # kk
                 sb_lst.append(sph)
 
@@ -102,3 +96,392 @@ def divideShareEdge(d: SPH.SPH, div: []) -> []:
         continue # k
 
     return sb_lst
+
+class SPHBlock:
+    ''' SPHBlock
+    divideBlocksで分割されたブロックのSPHデータとインデックス情報
+
+    Attributes
+    ----------
+    sph: SPH.SPH
+      ブロックのSPHデータ(ゴースト層を含む)
+    id: int
+      ブロックID(i + div[0]*(j + div[1]*k))
+    index: int[3]
+      ブロックの各軸方向のインデックス(i, j, k)
+    offset: int[3]
+      ゴースト層を含むブロックの先頭格子点の、元データでのインデックス
+    ownOffset: int[3]
+      ゴースト層を除いたブロックの先頭格子点の、元データでのインデックス
+    ownDims: int[3]
+      ゴースト層を除いたブロックの格子サイズ
+    ghostLo: int[3]
+      各軸方向の負側のゴースト層の幅(元データの境界では0)
+    ghostHi: int[3]
+      各軸方向の正側のゴースト層の幅(元データの境界では0)
+    neighbors: dict
+      隣接ブロックのID. キーは(di, dj, dk) (各-1~1, (0,0,0)を除く26方向)、
+      隣接ブロックが無い場合は-1
+    '''
+    def __init__(self):
+        self.sph = None
+        self.id = 0
+        self.index = [0, 0, 0]
+        self.offset = [0, 0, 0]
+        self.ownOffset = [0, 0, 0]
+        self.ownDims = [0, 0, 0]
+        self.ghostLo = [0, 0, 0]
+        self.ghostHi = [0, 0, 0]
+        self.neighbors = {}
+        return
+
+def divideBlocks(d: SPH.SPH, div: [], ghost=(0, 1),
+                 copy: bool =False) -> [SPHBlock]:
+    ''' divideBlocks
+    SPHデータについて、ゴースト層付きのブロック分割を行う
+    各ブロックの担当格子点はdivideShareEdgeと同じ分割で重複なく割り当て、
+    その両側に指定した幅のゴースト層を加える(元データの境界では切り詰める).
+    ghost=(0, 1)の場合はdivideShareEdgeと同じ分割になる.
+    copy=Falseの場合、各ブロックのSPHデータは元データのビュー(コピー無し)で、
+    _dataは(Z, Y, X[, veclen])の多次元配列となる(SPH.dataを参照).
+    格子点へのアクセスにはdataIndexed()を用いること.
+
+    Parameters
+    ----------
+    d: SPH.SPH
+      分割するSPHデータ
+    div: int[3]
+      各軸方向の分割数(>0)
+    ghost: int or (int, int)
+      ゴースト層の幅. 整数の場合は両側同じ幅、(負側, 正側)で個別に指定
+    copy: bool
+      Trueの場合、各ブロックのデータを連続した1次元配列にコピーする
+
+    Returns
+    -------
+    SPHBlock[]: 分割されたブロックのリスト(ID順)、空のリスト=失敗
+    '''
+    blk_lst = []
+    if d._veclen < 1 or d._data is None:
+        return blk_lst
+    if div[0] < 1 or div[1] < 1 or div[2] < 1:
+        return blk_lst
+    if isinstance(ghost, int):
+        gLo, gHi = ghost, ghost
+    else:
+        gLo, gHi = ghost[0], ghost[1]
+    if gLo < 0 or gHi < 0:
+        return blk_lst
+    step = [int(d._dims[i] / div[i]) for i in range(3)]
+    if step[0] < 1 or step[1] < 1 or step[2] < 1:
+        return blk_lst
+
+    # owned ranges of each axis
+    own = []
+    for a in range(3):
+        st = [n * step[a] for n in range(div[a])] + [d._dims[a]]
+        own.append([(st[n], st[n+1]) for n in range(div[a])])
+
+    vol = d.dataIndexed()
+    for k in range(div[2]):
+        for j in range(div[1]):
+            for i in range(div[0]):
+                bi = (i, j, k)
+                blk = SPHBlock()
+                blk.id = i + div[0] * (j + div[1] * k)
+                blk.index = list(bi)
+                rng = []
+                for a in range(3):
+                    o0, o1 = own[a][bi[a]]
+                    s0 = max(o0 - gLo, 0)
+                    s1 = min(o1 + gHi, d._dims[a])
+                    blk.ownOffset[a] = o0
+                    blk.ownDims[a] = o1 - o0
+                    blk.offset[a] = s0
+                    blk.ghostLo[a] = o0 - s0
+                    blk.ghostHi[a] = s1 - o1
+                    rng.append((s0, s1))
+                    continue # a
+
+                for dk in (-1, 0, 1):
+                    for dj in (-1, 0, 1):
+                        for di in (-1, 0, 1):
+                            if di == 0 and dj == 0 and dk == 0:
+                                continue
+                            ni, nj, nk = i + di, j + dj, k + dk
+                            if 0 <= ni < div[0] and 0 <= nj < div[1] \
+                               and 0 <= nk < div[2]:
+                                nid = ni + div[0] * (nj + div[1] * nk)
+                            else:
+                                nid = -1
+                            blk.neighbors[(di, dj, dk)] = nid
+                            continue # di
+                        continue # dj
+                    continue # dk
+
+                sph = SPH.SPH()
+                sph._dims[:] = [rng[a][1] - rng[a][0] for a in range(3)]
+                sph._org[:] = [d._org[a] + d._pitch[a] * rng[a][0]
+                               for a in range(3)]
+                sph._pitch[:] = d._pitch[:]
+                sph._veclen = d._veclen
+                sph._step = d._step
+                sph._time = d._time
+                sph._dtype = d._dtype
+                sph._data = vol[rng[2][0]:rng[2][1], rng[1][0]:rng[1][1],
+                                rng[0][0]:rng[0][1]]
+                if copy:
+                    sph._data = np.ascontiguousarray(sph._data).reshape((-1))
+                sph._min = None
+                sph._max = None
+                blk.sph = sph
+                blk_lst.append(blk)
+                continue # i
+            continue # j
+        continue # k
+
+    return blk_lst
+
+def divideShareEdgeToFiles(path: str, div: [], outPattern: str,
+                           workers: int =None) -> [str]:
+    ''' divideShareEdgeToFiles
+    .sphファイルについて、divideShareEdgeと同じ分割を行い、各ブロックを
+    個別の.sphファイルに書き出す.
+    元データはZ方向のブロック層ごとのスラブ単位で読み込み、スラブ内の
+    各ブロックをワーカースレッドで並列に書き出すため、メモリ使用量は
+    スラブ1枚分で抑えられる.
+
+    Parameters
+    ----------
+    path: str
+      分割する.sphファイルのパス
+    div: int[3]
+      各軸方向の分割数(>0)
+    outPattern: str
+      出力ファイルパスの書式. str.formatでid(ブロックID), i, j, k
+      (各軸方向のブロックインデックス)が置換される
+      例: 'out/block_{id:04d}.sph'
+    workers: int
+      書き出しのワーカー数(None=os.cpu_count())
+
+    Returns
+    -------
+    str[]: 出力したファイルパスのリスト(ブロックID順)、空のリスト=失敗
+    '''
+    out_lst = []
+    hdr = SPH.SPH()
+    if not hdr.loadHeader(path):
+        return out_lst
+    if div[0] < 1 or div[1] < 1 or div[2] < 1:
+        return out_lst
+    sbDim = int(hdr._dims[2] / div[2]) + (1 if div[2] != 1 else 0)
+    if sbDim < 1 or hdr._dims[2] - (sbDim - 1) * (div[2] - 1) < 1:
+        return out_lst
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    def _save(blk, k):
+        i, j = blk.index[0], blk.index[1]
+        bid = i + div[0] * (j + div[1] * k)
+        opath = outPattern.format(id=bid, i=i, j=j, k=k)
+        if not blk.sph.save(opath):
+            return None
+        return opath
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        z0 = 0
+        for k in range(div[2]):
+            z1 = hdr._dims[2] if k == div[2] - 1 else z0 + sbDim
+            slab = SPH.SPH()
+            if not slab.loadSubBox(path, zrange=(z0, z1)):
+                return []
+            blks = divideBlocks(slab, [div[0], div[1], 1], ghost=(0, 1))
+            if len(blks) != div[0] * div[1]:
+                return []
+            res = list(ex.map(lambda b: _save(b, k), blks))
+            if None in res:
+                return []
+            out_lst.extend(res)
+            z0 = z1 - 1
+            continue # k
+
+    return out_lst
+
+def _coversRegion(boxes: [], gdims: []) -> bool:
+    ''' _coversRegion
+    ブロックの範囲(格子インデックス)が全体の領域を隙間なく覆うか判定する.
+    各軸のブロック境界で区切った粗い格子上で判定するため、全体の格子サイズに
+    比例するメモリを必要としない
+    '''
+    edges = [np.unique([0, gdims[a]] + [b[a][0] for b in boxes]
+                       + [b[a][1] for b in boxes]) for a in range(3)]
+    cov = np.zeros((len(edges[2]) - 1, len(edges[1]) - 1, len(edges[0]) - 1),
+                   dtype=bool)
+    for b in boxes:
+        r = [(np.searchsorted(edges[a], b[a][0]),
+              np.searchsorted(edges[a], b[a][1])) for a in range(3)]
+        cov[r[2][0]:r[2][1], r[1][0]:r[1][1], r[0][0]:r[0][1]] = True
+        continue # b
+    return bool(cov.all())
+
+def _placeBlocks(blocks: [], offs: [], dst: np.ndarray, veclen: int,
+                 tol: float) -> bool:
+    ''' _placeBlocks
+    ブロックのデータを結合先の配列に配置し、共有エッジの値を検証する
+    '''
+    placed = []
+    for n, b in enumerate(blocks):
+        if isinstance(b, str):
+            d = SPH.SPH()
+            if not d.load(b, mmap=True):
+                return False
+        else:
+            d = b
+        src = d.dataIndexed().reshape(
+            (d._dims[2], d._dims[1], d._dims[0], veclen))
+        o = offs[n]
+        box = [(o[a], o[a] + d._dims[a]) for a in range(3)]
+
+        # check shared edges with the blocks already placed
+        for pbox in placed:
+            ib = [(max(box[a][0], pbox[a][0]), min(box[a][1], pbox[a][1]))
+                  for a in range(3)]
+            if ib[0][0] >= ib[0][1] or ib[1][0] >= ib[1][1] \
+               or ib[2][0] >= ib[2][1]:
+                continue
+            dv = dst[ib[2][0]:ib[2][1], ib[1][0]:ib[1][1], ib[0][0]:ib[0][1]]
+            sv = src[ib[2][0]-o[2]:ib[2][1]-o[2], ib[1][0]-o[1]:ib[1][1]-o[1],
+                     ib[0][0]-o[0]:ib[0][1]-o[0]]
+            if not np.allclose(dv, sv, rtol=0.0, atol=tol):
+                print("divide.mergeBlocks: shared edge mismatch at block %d."
+                      % n)
+                return False
+            continue # pbox
+
+        dst[box[2][0]:box[2][1], box[1][0]:box[1][1], box[0][0]:box[0][1]] \
+            = src
+        placed.append(box)
+        continue # n
+    return True
+
+def mergeBlocks(blocks: [], outPath: str =None, tol: float =0.0) -> SPH.SPH:
+    ''' mergeBlocks
+    分割されたSPHデータ(またはそのファイル)を一つのSPHデータに結合する
+    (divideShareEdge, divideBlocks, divideShareEdgeToFilesの逆変換)
+    各ブロックの配置はorg/pitch/dimsから求め、ブロック間で重複する
+    格子点(共有エッジ)の値が一致することを検証する.
+    ブロックにファイルパスを指定した場合、ヘッダのみを先に読んで配置を決め、
+    データは1ブロックずつメモリマップで読み込む.
+    outPathを指定した場合、結合結果を直接.sphファイルにメモリマップで書き込み、
+    全体データをメモリ上に確保しない.
+
+    Parameters
+    ----------
+    blocks: (SPH.SPH or str)[]
+      結合するSPHデータ、または.sphファイルパスのリスト
+    outPath: str
+      出力する.sphファイルのパス. Noneの場合はメモリ上に結合する
+    tol: float
+      共有エッジの値の一致判定の許容誤差(絶対値)
+
+    Returns
+    -------
+    SPH.SPH: 結合したSPHデータ(outPath指定時は出力ファイルをメモリマップ
+             したもの)、None: 失敗(ブロックが全体を覆わない場合を含む)
+    '''
+    if len(blocks) < 1:
+        return None
+
+    # headers
+    hdrs = []
+    for b in blocks:
+        if isinstance(b, str):
+            h = SPH.SPH()
+            if not h.loadHeader(b):
+                return None
+        else:
+            h = b
+            if h._data is None:
+                return None
+        hdrs.append(h)
+    h0 = hdrs[0]
+    dtype = SPH.SPH.DT_SINGLE
+    for h in hdrs:
+        if h._veclen != h0._veclen or \
+           not np.allclose(h._pitch, h0._pitch, rtol=1e-5, atol=0.0):
+            print("divide.mergeBlocks: veclen or pitch mismatch.")
+            return None
+        if h._dtype == SPH.SPH.DT_DOUBLE:
+            dtype = SPH.SPH.DT_DOUBLE
+    veclen = h0._veclen
+    pitch = list(h0._pitch)
+
+    # placement
+    gorg = [min([h._org[a] for h in hdrs]) for a in range(3)]
+    offs = []
+    for h in hdrs:
+        off = [0, 0, 0]
+        for a in range(3):
+            fo = (h._org[a] - gorg[a]) / pitch[a] if pitch[a] != 0 else 0.0
+            off[a] = int(round(fo))
+            if abs(fo - off[a]) > 1e-3:
+                print("divide.mergeBlocks: block is not aligned to the grid.")
+                return None
+        offs.append(off)
+    gdims = [max([offs[n][a] + hdrs[n]._dims[a] for n in range(len(hdrs))])
+             for a in range(3)]
+
+    boxes = [[(offs[n][a], offs[n][a] + hdrs[n]._dims[a]) for a in range(3)]
+             for n in range(len(hdrs))]
+    if not _coversRegion(boxes, gdims):
+        print("divide.mergeBlocks: blocks do not cover the whole region.")
+        return None
+
+    # destination
+    sph = SPH.SPH()
+    sph._dims[:] = gdims
+    sph._org[:] = gorg
+    sph._pitch[:] = pitch
+    sph._veclen = veclen
+    sph._dtype = dtype
+    sph._step = h0._step
+    sph._time = h0._time
+    ndt = np.float64 if dtype == SPH.SPH.DT_DOUBLE else np.float32
+    shape = (gdims[2], gdims[1], gdims[0], veclen)
+    dsz = gdims[0] * gdims[1] * gdims[2] * veclen * np.dtype(ndt).itemsize
+    if outPath is None:
+        dst = np.zeros(shape, dtype=ndt)
+        if not _placeBlocks(blocks, offs, dst, veclen, tol):
+            return None
+        sph._data = dst.reshape((-1))
+        sph._calcMinMax()
+        return sph
+
+    # the record marker of .sph file is a 4-byte signed integer
+    if dsz > 0x7fffffff:
+        print("divide.mergeBlocks: data record of %d bytes exceeds the 2GiB "
+              "limit of .sph file: %s" % (dsz, outPath))
+        return None
+    try:
+        with open(outPath, 'wb') as ofp:
+            sph._writeHeader(ofp)
+            ofp.write(struct.pack('i', dsz))
+            offset = ofp.tell()
+            ofp.seek(offset + dsz)
+            ofp.write(struct.pack('i', dsz))
+        dst = np.memmap(outPath, dtype=ndt, mode='r+', offset=offset,
+                        shape=shape)
+    except Exception as e:
+        print("divide.mergeBlocks: write failed: %s: %s" % (outPath, e))
+        if os.path.exists(outPath): os.remove(outPath)
+        return None
+    ok = _placeBlocks(blocks, offs, dst, veclen, tol)
+    if ok: dst.flush()
+    del dst
+    sph = SPH.SPH()
+    if not ok or not sph.load(outPath, mmap=True):
+        # remove the partially written file
+        sph = None
+        os.remove(outPath)
+        return None
+    return sph
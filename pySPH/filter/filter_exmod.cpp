@@ -4,12 +4,49 @@
 #include <pybind11/pybind11.h>
 
 #include "vecrot_exmod.hpp"
+#include "vortex_exmod.hpp"
 
 
 PYBIND11_MODULE(filter_exmod, m)
 {
     m.doc() = "SPH filter external C++ module";
 
-    m.def("calc_curl", &calc_curl<float>, "");
-    m.def("calc_curl", &calc_curl<double>, "");
+    m.def("set_num_threads", &set_num_threads,
+          "set number of threads used by the kernels", py::arg("n"));
+    m.def("get_num_threads", &get_num_threads,
+          "number of threads used by the kernels");
+
+    m.def("calc_curl", &calc_curl<float>, "",
+          py::arg("x").noconvert(),
+          py::arg("px"), py::arg("py"), py::arg("pz"),
+          py::arg("nthreads") = 0);
+    m.def("calc_curl", &calc_curl<double>, "",
+          py::arg("x").noconvert(),
+          py::arg("px"), py::arg("py"), py::arg("pz"),
+          py::arg("nthreads") = 0);
+    m.def("calc_curl_minmax", &calc_curl_minmax<float>,
+          "curl and (min, max) of each component",
+          py::arg("x").noconvert(),
+          py::arg("px"), py::arg("py"), py::arg("pz"),
+          py::arg("nthreads") = 0);
+    m.def("calc_curl_minmax", &calc_curl_minmax<double>,
+          "curl and (min, max) of each component",
+          py::arg("x").noconvert(),
+          py::arg("px"), py::arg("py"), py::arg("pz"),
+          py::arg("nthreads") = 0);
+
+    m.attr("VORTEX_Q") = int(VORTEX_Q);
+    m.attr("VORTEX_LAMBDA2") = int(VORTEX_LAMBDA2);
+    m.attr("VORTEX_HELICITY") = int(VORTEX_HELICITY);
+    m.attr("VORTEX_VORTMAG") = int(VORTEX_VORTMAG);
+    m.def("calc_vortex", &calc_vortex<float>,
+          "vortex identification fields and (min, max) of each field",
+          py::arg("x").noconvert(),
+          py::arg("px"), py::arg("py"), py::arg("pz"),
+          py::arg("flags"), py::arg("nthreads") = 0);
+    m.def("calc_vortex", &calc_vortex<double>,
+          "vortex identification fields and (min, max) of each field",
+          py::arg("x").noconvert(),
+          py::arg("px"), py::arg("py"), py::arg("pz"),
+          py::arg("flags"), py::arg("nthreads") = 0);
 }
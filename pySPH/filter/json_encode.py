@@ -10,42 +10,181 @@ from .. import SPH
 
 import json
 import base64
+import struct
+import zlib
 import _pickle as pickle
 
-def toJSON(d: SPH.SPH) -> str:
+# バイナリエンベロープ
+#  magic, version, flags, dtype, veclen, dims[3], step, time,
+#  org[3], pitch[3], 生データのバイト数 (リトルエンディアン固定)
+MAGIC = b'SPHB'
+VERSION = 1
+FLAG_ZLIB = 1
+_HEADER = struct.Struct('<4sHHII3IqdddddddQ')
+
+
+def _dataArray(d: SPH.SPH, ndt) -> np.ndarray:
+    ''' _dataArray
+    SPHデータの配列を指定型のC連続1次元配列として返す(可能ならコピーしない)
+    '''
+    arr = d._data
+    if arr.ndim > 1 and not arr.flags.c_contiguous:
+        arr = np.ascontiguousarray(arr)
+    arr = arr.reshape((-1)).astype(ndt, copy=False)
+    if not arr.flags.c_contiguous:
+        # 1次元のストライド付きビュー(extractScalar等)
+        arr = np.ascontiguousarray(arr)
+    return arr
+
+def toBinary(d: SPH.SPH, compress: bool =False, level: int =6,
+             float32: bool =False) -> bytes:
+    ''' toBinary
+    SPHデータをバージョン付きバイナリエンベロープ(固定長ヘッダ+生データ)に
+    変換する
+
+    Parameters
+    ----------
+    d: SPH.SPH
+      変換するSPHデータ
+    compress: bool
+      zlibで圧縮する(デフォルト: False)
+    level: int
+      zlibの圧縮レベル(デフォルト: 6)
+    float32: bool
+      倍精度データを単精度に変換して格納する(デフォルト: False)
+
+    Returns
+    -------
+    bytes: バイナリデータ。失敗した場合はNone
+    '''
+    if d is None or d._data is None:
+        return None
+    dtype = d._dtype
+    if float32: dtype = SPH.SPH.DT_SINGLE
+    ndt = '<f8' if dtype == SPH.SPH.DT_DOUBLE else '<f4'
+    arr = _dataArray(d, ndt)
+    flags = 0
+    payload = memoryview(arr).cast('B')
+    if compress:
+        flags |= FLAG_ZLIB
+        payload = zlib.compress(payload, level)
+    hdr = _HEADER.pack(MAGIC, VERSION, flags, dtype, d._veclen,
+                       d._dims[0], d._dims[1], d._dims[2],
+                       d._step, d._time,
+                       d._org[0], d._org[1], d._org[2],
+                       d._pitch[0], d._pitch[1], d._pitch[2],
+                       arr.nbytes)
+    return b''.join((hdr, payload))
+
+def fromBinary(buf) -> SPH.SPH:
+    ''' fromBinary
+    バイナリエンベロープからSPHデータを復元する。
+    非圧縮の場合、データ配列はbufを共有する読み込み専用の配列となる
+
+    Parameters
+    ----------
+    buf: bytes-like
+      toBinaryで作成したバイナリデータ
+
+    Returns
+    -------
+    SPH.SPH: 復元されたSPHデータ。失敗した場合はNone
+    '''
+    mv = memoryview(buf)
+    if mv.nbytes < _HEADER.size:
+        return None
+    (magic, ver, flags, dtype, veclen, nx, ny, nz, step, tm,
+     ox, oy, oz, px, py, pz, nbytes) = _HEADER.unpack_from(mv, 0)
+    if magic != MAGIC or ver > VERSION:
+        return None
+    payload = mv[_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    ndt = '<f8' if dtype == SPH.SPH.DT_DOUBLE else '<f4'
+    cnt = nx * ny * nz * veclen
+    if len(payload) < nbytes or nbytes != cnt * np.dtype(ndt).itemsize:
+        return None
+
+    sph = SPH.SPH()
+    sph._dims = [nx, ny, nz]
+    sph._org = [ox, oy, oz]
+    sph._pitch = [px, py, pz]
+    sph._dtype = dtype
+    sph._veclen = veclen
+    sph._step = step
+    sph._time = tm
+    sph._data = np.frombuffer(payload, dtype=ndt, count=cnt)
+    sph._min = None
+    sph._max = None
+    return sph
+
+def toJSON(d: SPH.SPH, compress: bool =False, float32: bool =False) -> str:
     ''' toJSON
-    SPHデータについて、base64でエンコードしてJSON化する
+    SPHデータについて、メタデータとbase64でエンコードしたバイナリ
+    エンベロープをJSON化する
 
     Parameters
     ----------
     d: SPH.SPH
       JSON化するSPHデータ
+    compress: bool
+      zlibで圧縮する(デフォルト: False)
+    float32: bool
+      倍精度データを単精度に変換して格納する(デフォルト: False)
 
     Returns
     -------
     str: 文字列化したJSONデータ
     '''
+    buf = toBinary(d, compress=compress, float32=float32)
+    if buf is None:
+        return None
     jd = {
         'type': 'sph',
-        'data': base64.b64encode(pickle.dumps(d)).decode('utf-8'),
+        'format': 'sphb',
+        'version': VERSION,
+        'dims': list(d._dims),
+        'org': list(d._org),
+        'pitch': list(d._pitch),
+        'veclen': d._veclen,
+        'step': d._step,
+        'time': d._time,
+        'min': [float(v) for v in d.min],
+        'max': [float(v) for v in d.max],
+        'data': base64.b64encode(buf).decode('ascii'),
         }
     str_data = json.dumps(jd)
     return str_data
 
-def fromJSON(sd: str) -> SPH.SPH:
+def fromJSON(sd: str, allow_pickle: bool =False) -> SPH.SPH:
     ''' fromJSON
-    base64エンコードでJSON化されたSPHデータを復元する
+    JSON化されたSPHデータを復元する。
+    旧形式(pickleをbase64エンコードしたもの)はallow_pickle=Trueの場合のみ
+    復元する(pickleは任意のコードを実行し得るため、信頼できないデータには
+    使用しないこと)
 
     Parameters
     ----------
     sd: str
       文字列化したJSONデータ
+    allow_pickle: bool
+      旧形式の復元を許可する(デフォルト: False)
 
     Returns
     -------
-    SPH.SPH: 復元されたSPHデータ
+    SPH.SPH: 復元されたSPHデータ。失敗した場合はNone
     '''
     jd = json.loads(sd)
     d = base64.b64decode(jd['data'].encode())
-    sph = pickle.loads(d)
+    if jd.get('format') != 'sphb':
+        if not allow_pickle:
+            return None
+        sph = pickle.loads(d)
+        return sph
+    sph = fromBinary(d)
+    if sph is None:
+        return None
+    if 'min' in jd and 'max' in jd:
+        sph._min = jd['min']
+        sph._max = jd['max']
     return sph
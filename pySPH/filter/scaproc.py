@@ -7,49 +7,191 @@ SPH scalar process filter
 import sys, os
 import numpy as np
 from .. import SPH
-from . import filter_exmod
 
-def asUchar(d: SPH.SPH, minMax:[]=None) -> np.ndarray:
-    ''' asUchar
-    minMaxで指定された値域を(0~255)に正規化して、dtype=uint8のnumpy配列に変換する
+""" number of grid points processed per chunk """
+CHUNK_SIZE = 64 * 1024
+
+""" number of entries of the lookup table for transfer functions """
+LUT_SIZE = {8: 4096, 16: 65536}
+
+def _transferLUT(transfer: str, bits: int, d_range: [],
+                 gamma: float) -> np.ndarray:
+    ''' _transferLUT
+    正規化された値(0~1)から量子化値への変換テーブルを生成する
+    '''
+    t = np.linspace(0.0, 1.0, LUT_SIZE[bits])
+    if transfer == 'log':
+        # log scale of the value range: log(v/min) / log(max/min)
+        ratio = d_range[1] / d_range[0]
+        f = np.log1p(t * (ratio - 1.0)) / np.log(ratio)
+    else: # gamma
+        f = t ** gamma
+    maxv = (1 << bits) - 1
+    return np.clip(np.rint(f * maxv), 0, maxv).astype('uint%d' % bits)
+
+def _dataRange(d: SPH.SPH) -> []:
+    ''' _dataRange
+    SPHデータの最小値・最大値をCHUNK_SIZE程度のチャンクごとに求める
+    (キャッシュされたd.min, d.maxは使用しない)
+    '''
+    vmin = None
+    vmax = None
+    for piece in d._dataPieces():
+        for s in range(0, piece.size, CHUNK_SIZE):
+            src = piece[s:s+CHUNK_SIZE]
+            cmin = src.min()
+            cmax = src.max()
+            if vmin is None or cmin < vmin: vmin = cmin
+            if vmax is None or cmax > vmax: vmax = cmax
+            continue # end of for(s)
+        continue # end of for(piece)
+    return [vmin, vmax]
+
+def quantize(d: SPH.SPH, minMax: [] =None, bits: int =8,
+             transfer: str =None, gamma: float =1.0,
+             out: np.ndarray =None, rounding: bool =False) -> np.ndarray:
+    ''' quantize
+    minMaxで指定された値域を(0~2^bits-1)に正規化して、uint8またはuint16の
+    numpy配列に変換する(デフォルトでは小数部を切り捨てる). 値域外の値は
+    値域の端にクリップする.
+    CHUNK_SIZE程度のチャンクごとにベクトル化して処理する.
 
     Parameters
     ----------
     d: SPH.SPH
-      vectorデータを持つSPHデータ
+      スカラーデータを持つSPHデータ
     minMax: [min, max]
-      値域: Noneの場合はdの最小値・最大値で正規化する
+      値域: Noneの場合(または各要素がNoneの場合)はdの最小値・最大値で
+      正規化する
+    bits: int
+      量子化ビット数(8: uint8, 16: uint16)
+    transfer: str
+      変換関数. None: 線形, 'log': 対数(値域の最小値>0が必要),
+      'gamma': 正規化値のgamma乗. 'log', 'gamma'はルックアップテーブルで
+      変換する
+    gamma: float
+      transfer='gamma'の場合の指数
+    out: np.ndarray
+      結果を書き込む配列(要素数と型が一致すること). Noneの場合は新たに確保する
+    rounding: bool
+      Trueの場合、最近接の整数に丸める(デフォルト: False、切り捨て)
 
     Returns
     -------
-    np.ndarray: dtype=uint8のNumpy配列
+    np.ndarray: (Z, Y, X)のuint8またはuint16のNumpy配列、None: 失敗
     '''
-    if d._veclen != 1:
+    if d._veclen != 1 or d._data is None:
+        return None
+    if bits not in (8, 16):
+        return None
+    if transfer not in (None, 'linear', 'log', 'gamma'):
         return None
 
-    d_range = minMax
-    if not d_range:
-        d_range = [d._data.min(), d._data.max()]
-    else:
-        if not d_range[0]:
-            d_range[0] = d._data.min()
-        if not d_range[0]:
-            d_range[1] = d._data.max()
+    d_range = [None, None]
+    if minMax:
+        d_range[:] = minMax[:2]
+    if d_range[0] is None or d_range[1] is None:
+        vmin, vmax = _dataRange(d)
+        if d_range[0] is None: d_range[0] = vmin
+        if d_range[1] is None: d_range[1] = vmax
+    # in float64 as the data chunks, so that the range maps onto 0~maxv
+    d_range = [float(v) for v in d_range]
     deno = d_range[1] - d_range[0]
     if deno <= 0.0:
         return None
+    if transfer == 'log' and d_range[0] <= 0.0:
+        return None
 
     dsz = d._dims[2]* d._dims[1]* d._dims[0]
     if dsz < 1:
         return None
-    ucd = np.array([0], dtype='uint8')
-    ucd = np.resize(ucd, (dsz))
+    udt = np.dtype('uint%d' % bits)
+    if out is None:
+        ucd = np.empty(dsz, dtype=udt)
+    else:
+        if out.size != dsz or out.dtype != udt or \
+           not out.flags.c_contiguous:
+            return None
+        ucd = out.reshape((-1))
+
+    lut = None
+    if transfer in ('log', 'gamma'):
+        lut = _transferLUT(transfer, bits, d_range, gamma)
+        maxv = lut.size - 1
+    else:
+        maxv = (1 << bits) - 1
+
+    k = 0
+    for piece in d._dataPieces():
+        for s in range(0, piece.size, CHUNK_SIZE):
+            src = piece[s:s+CHUNK_SIZE]
+            dst = ucd[k:k+src.size]
+            t = np.subtract(src, d_range[0], dtype=np.float64)
+            t *= maxv
+            t /= deno
+            np.clip(t, 0, maxv, out=t)
+            np.nan_to_num(t, copy=False, nan=0.0)
+            if lut is None:
+                if rounding: np.rint(t, out=t)
+                np.copyto(dst, t, casting='unsafe')
+            else:
+                np.take(lut, np.rint(t).astype(np.intp), out=dst)
+            k += src.size
+            continue # end of for(s)
+        continue # end of for(piece)
+
+    return np.reshape(ucd, [d._dims[2], d._dims[1], d._dims[0]])
+
+def asUchar(d: SPH.SPH, minMax:[]=None, transfer: str =None,
+            gamma: float =1.0, out: np.ndarray =None,
+            rounding: bool =False) -> np.ndarray:
+    ''' asUchar
+    minMaxで指定された値域を(0~255)に正規化して、dtype=uint8のnumpy配列に変換する
+
+    Parameters
+    ----------
+    d: SPH.SPH
+      スカラーデータを持つSPHデータ
+    minMax: [min, max]
+      値域: Noneの場合はdの最小値・最大値で正規化する
+    transfer: str
+      変換関数(quantize参照)
+    gamma: float
+      transfer='gamma'の場合の指数
+    out: np.ndarray
+      結果を書き込むuint8の配列. Noneの場合は新たに確保する
+    rounding: bool
+      Trueの場合、最近接の整数に丸める(デフォルト: False、切り捨て)
 
-    for i in range(dsz):
-        ucd[i] = 255 * (d._data[i] - d_range[0]) / deno
-        continue # end of for(i)
+    Returns
+    -------
+    np.ndarray: dtype=uint8のNumpy配列
+    '''
+    return quantize(d, minMax, 8, transfer, gamma, out, rounding)
 
-    ucd = np.reshape(ucd, [d._dims[2], d._dims[1], d._dims[0]])
-    return ucd
+def asUshort(d: SPH.SPH, minMax:[]=None, transfer: str =None,
+             gamma: float =1.0, out: np.ndarray =None,
+             rounding: bool =False) -> np.ndarray:
+    ''' asUshort
+    minMaxで指定された値域を(0~65535)に正規化して、dtype=uint16のnumpy配列に変換する
 
+    Parameters
+    ----------
+    d: SPH.SPH
+      スカラーデータを持つSPHデータ
+    minMax: [min, max]
+      値域: Noneの場合はdの最小値・最大値で正規化する
+    transfer: str
+      変換関数(quantize参照)
+    gamma: float
+      transfer='gamma'の場合の指数
+    out: np.ndarray
+      結果を書き込むuint16の配列. Noneの場合は新たに確保する
+    rounding: bool
+      Trueの場合、最近接の整数に丸める(デフォルト: False、切り捨て)
 
+    Returns
+    -------
+    np.ndarray: dtype=uint16のNumpy配列
+    '''
+    return quantize(d, minMax, 16, transfer, gamma, out, rounding)
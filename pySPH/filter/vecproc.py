@@ -6,12 +6,22 @@ SPH vector process filter
 
 import sys, os
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from .. import SPH
-from . import filter_exmod
+try:
+    from . import filter_exmod
+except ImportError:
+    # C++ module is not built, use the numpy implementations
+    filter_exmod = None
 
-def extractScalar(d: SPH.SPH, dataIdx: int) -> SPH.SPH:
+""" number of grid points processed per chunk """
+CHUNK_SIZE = 64 * 1024
+
+def extractScalar(d: SPH.SPH, dataIdx: int, copy: bool =False) -> SPH.SPH:
     ''' extractScalar
     ベクトルデータを持つSPHからスカラーのSPHを生成する
+    copy=Falseの場合、生成したSPHのデータは元データの成分を跨いだ
+    ストライド付きのビュー(コピー無し)となる.
 
     Parameters
     ----------
@@ -19,12 +29,14 @@ def extractScalar(d: SPH.SPH, dataIdx: int) -> SPH.SPH:
       vectorデータを持つSPHデータ
     dataIdx: int
       抽出するスカラーデータのインデックス番号
+    copy: bool
+      Trueの場合、抽出したデータを連続した配列にコピーする
 
     Returns
     -------
     SPH.SPH: 抽出したスカラーのSPHデータ、None: 失敗
     '''
-    if d._veclen < 1:
+    if d._veclen < 1 or d._data is None:
         return None
     if dataIdx < 0 or dataIdx >= d._veclen:
         return None
@@ -36,83 +48,159 @@ def extractScalar(d: SPH.SPH, dataIdx: int) -> SPH.SPH:
     sph._veclen = 1
     sph._step = d._step
     sph._time = d._time
-    if d._dtype == SPH.SPH.DT_DOUBLE:
-        sph._dtype = SPH.SPH.DT_DOUBLE
-        sph._data = np.array(0, dtype=np.float64)
-    else:
-        sph._dtype = SPH.SPH.DT_SINGLE
-        sph._data = np.array(0, dtype=np.float32)
+    sph._dtype = d._dtype
     dimSz = sph._dims[0] * sph._dims[1] * sph._dims[2]
     if dimSz < 1:
         return None
-    sph._data.resize(dimSz)
-
-    val = d._data[dataIdx]
-    sph._min = [val]
-    sph._max = [val]
-    for i in range(dimSz):
-        val  = d._data[i*sph._datalen + dataIdx]
-        sph._data[i] = val
-        if val < sph._min[0]: sph._min[0] = val
-        if val > sph._max[0]: sph._max[0] = val
-        continue # end of for(i)
+
+    if d._veclen == 1:
+        sph._data = d._data
+    elif d._data.ndim == 1:
+        sph._data = d._data[dataIdx::d._veclen]
+    else:
+        sph._data = d.dataIndexed()[..., dataIdx]
+    if copy:
+        sph._data = np.ascontiguousarray(sph._data).reshape((-1))
+    sph._calcMinMax()
     return sph
 
-def vectorMag(d: SPH.SPH) -> SPH.SPH:
+def splitComponents(d: SPH.SPH, copy: bool =False) -> [SPH.SPH]:
+    ''' splitComponents
+    ベクトルデータを持つSPHを成分ごとのスカラーのSPHに分解する
+    copy=Falseの場合、各SPHのデータは元データのビュー(コピー無し)となる.
+
+    Parameters
+    ----------
+    d: SPH.SPH
+      vectorデータを持つSPHデータ
+    copy: bool
+      Trueの場合、各成分のデータを連続した配列にコピーする
+
+    Returns
+    -------
+    SPH.SPH[]: 成分ごとのスカラーのSPHデータのリスト、空のリスト: 失敗
+    '''
+    sph_lst = []
+    for l in range(d._veclen):
+        sph = extractScalar(d, l, copy)
+        if sph is None:
+            return []
+        sph_lst.append(sph)
+        continue # end of for(l)
+    return sph_lst
+
+def _magChunk(src: np.ndarray, dst: np.ndarray) -> (float, float):
+    ''' _magChunk
+    チャンク1つ分のベクトルのノルムを計算し、最小値・最大値を返す
+    '''
+    np.einsum('...i,...i->...', src, src, out=dst)
+    np.sqrt(dst, out=dst)
+    return (dst.min(), dst.max())
+
+def vectorMag(d: SPH.SPH, out=None, workers: int =1) -> SPH.SPH:
     ''' vectorMag
     ベクトルデータを持つSPHからベクトルのノルムをスカラーとして持つSPHを生成する
+    格子点をCHUNK_SIZE程度のチャンクに分けてベクトル化して計算する.
 
     Parameters
     ----------
     d: SPH.SPH
       vectorデータを持つSPHデータ
+    out: SPH.SPH or np.ndarray
+      結果を書き込むバッファ. 格子点数とdtypeが一致するSPHデータ
+      (そのデータ配列を再利用する)、またはnumpy配列を指定する.
+      Noneの場合は新たに確保する
+    workers: int
+      チャンクを並列に処理するスレッド数
 
     Returns
     -------
     SPH.SPH: ベクトルノルムのスカラーSPHデータ、None: 失敗
     '''
-    if d._veclen < 1:
+    if d._veclen < 1 or d._data is None:
+        return None
+    dimSz = d._dims[0] * d._dims[1] * d._dims[2]
+    if dimSz < 1:
         return None
+    ndt = np.float64 if d._dtype == SPH.SPH.DT_DOUBLE else np.float32
+    if d._data.dtype != ndt:
+        ndt = d._data.dtype.newbyteorder('=')
 
-    sph = SPH.SPH()
+    # output buffer
+    if isinstance(out, SPH.SPH):
+        sph = out
+        buf = sph._data
+    else:
+        sph = SPH.SPH()
+        buf = out
+    if buf is not None:
+        if buf.size != dimSz or buf.dtype != ndt or \
+           not buf.flags.c_contiguous:
+            if out is not None and not isinstance(out, SPH.SPH):
+                return None
+            buf = None
+    if buf is None:
+        buf = np.empty(dimSz, dtype=ndt)
+    sph._data = buf.reshape((-1))
     sph._dims[:] = d._dims[:]
     sph._org[:] = d._org[:]
     sph._pitch[:] = d._pitch[:]
     sph._veclen = 1
     sph._step = d._step
     sph._time = d._time
-    if d._dtype == SPH.SPH.DT_DOUBLE:
-        sph._dtype = SPH.SPH.DT_DOUBLE
-        sph._data = np.array(0, dtype=np.float64)
+    sph._dtype = d._dtype
+
+    # chunks of (Z, Y) range
+    src = d.dataIndexed()
+    if d._veclen == 1:
+        src = src[..., np.newaxis]
+    dst = sph._data.reshape((d._dims[2], d._dims[1], d._dims[0]))
+    plane = d._dims[0] * d._dims[1]
+    tasks = []
+    if plane >= CHUNK_SIZE:
+        nj = max(1, CHUNK_SIZE // d._dims[0])
+        for k in range(d._dims[2]):
+            for j in range(0, d._dims[1], nj):
+                tasks.append((src[k, j:j+nj], dst[k, j:j+nj]))
     else:
-        sph._dtype = SPH.SPH.DT_SINGLE
-        sph._data = np.array(0, dtype=np.float32)
-    dimSz = sph._dims[0] * sph._dims[1] * sph._dims[2]
-    if dimSz < 1:
-        return None
-    sph._data.resize(dimSz)
-
-    vl = np.linalg.norm(d._data[0:d._veclen], ord=2)
-    sph._min = [vl]
-    sph._max = [vl]
-    for i in range(dimSz):
-        idx = i * d._veclen
-        vl = np.linalg.norm(d._data[idx:idx+d._veclen], ord=2)
-        sph._data[i] = vl
-        if vl < sph._min[0]: sph._min[0] = vl
-        if vl > sph._max[0]: sph._max[0] = vl
-        continue # end of for(i)
+        nk = CHUNK_SIZE // plane
+        for k in range(0, d._dims[2], nk):
+            tasks.append((src[k:k+nk], dst[k:k+nk]))
+
+    if workers is not None and workers > 1 and len(tasks) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            mm = list(ex.map(lambda t: _magChunk(*t), tasks))
+    else:
+        mm = [_magChunk(*t) for t in tasks]
+    sph._min = [min([m[0] for m in mm]).item()]
+    sph._max = [max([m[1] for m in mm]).item()]
     return sph
 
-def vectorCurl(d: SPH.SPH) -> SPH.SPH:
+def setNumThreads(n: int):
+    ''' setNumThreads
+    C++実装のフィルタが使用するスレッド数を設定する
+
+    Parameters
+    ----------
+    n: int
+      スレッド数(1未満の場合はOpenMPの既定値のまま)
+    '''
+    if filter_exmod is not None:
+        filter_exmod.set_num_threads(n)
+    return
+
+def vectorCurl(d: SPH.SPH, nthreads: int =0) -> SPH.SPH:
     ''' vectorCurl
     ベクトルデータを持つSPHからベクトルの回転をベクトルとして持つSPHを生成する
-    (C++実装)
+    (C++実装、OpenMPでk方向に並列化)
+    C++モジュールがビルドされていない場合はvectorCurlPyで計算する.
 
     Parameters
     ----------
     d: SPH.SPH
       vectorデータを持つSPHデータ
+    nthreads: int
+      スレッド数(0の場合はsetNumThreadsの設定値)
 
     Returns
     -------
@@ -120,6 +208,8 @@ def vectorCurl(d: SPH.SPH) -> SPH.SPH:
     '''
     if not d._veclen == 3:
         return None
+    if filter_exmod is None:
+        return vectorCurlPy(d)
     sph = SPH.SPH()
     sph._dims[:] = d._dims[:]
     sph._org[:] = d._org[:]
@@ -127,37 +217,63 @@ def vectorCurl(d: SPH.SPH) -> SPH.SPH:
     sph._veclen = d._veclen
     sph._step = d._step
     sph._time = d._time
-    if d._dtype == SPH.SPH.DT_DOUBLE:
-        sph._dtype = SPH.SPH.DT_DOUBLE
-        sph._data = np.array(0, dtype=np.float64)
-    else:
-        sph._dtype = SPH.SPH.DT_SINGLE
-        sph._data = np.array(0, dtype=np.float32)
-    dimSz = sph._dims[0] * sph._dims[1] * sph._dims[2]
-    if dimSz < 8:
+    sph._dtype = d._dtype
+    if sph._dims[0] < 2 or sph._dims[1] < 2 or sph._dims[2] < 2:
         return None
 
-    dd = d._data.reshape([sph._dims[2], sph._dims[1], sph._dims[0], 3])
-    td = filter_exmod.calc_curl(dd, sph._pitch[0],sph._pitch[1],sph._pitch[2])
+    if d._dtype == SPH.SPH.DT_DOUBLE:
+        ndt = np.float64
+    else:
+        ndt = np.float32
+    # C-contiguous array of the exact type, so that the overload of ndt
+    # is selected (the kernel does not convert)
+    dd = np.ascontiguousarray(d.dataIndexed(), dtype=ndt)
+    td, sph._min, sph._max = filter_exmod.calc_curl_minmax(
+        dd, sph._pitch[0], sph._pitch[1], sph._pitch[2], nthreads)
     sph._data = td.ravel()
+    return sph
+
+def _diff(a: np.ndarray, axis: int, h: float,
+          out: np.ndarray =None) -> np.ndarray:
+    ''' _diff
+    配列のaxis方向の1階差分を計算する(端は片側差分、内部は中心差分)
+
+    Parameters
+    ----------
+    a: np.ndarray
+      (Z, Y, X)の配列
+    axis: int
+      差分を取る軸(0=Z, 1=Y, 2=X)
+    h: float
+      格子間隔
+    out: np.ndarray
+      結果を書き込む配列(Noneの場合は新たに確保する)
+
+    Returns
+    -------
+    np.ndarray: 差分の配列
+    '''
+    if out is None:
+        out = np.empty(a.shape, dtype=a.dtype)
+    def sl(s):
+        idx = [slice(None)] * a.ndim
+        idx[axis] = s
+        return tuple(idx)
+    np.subtract(a[sl(slice(2, None))], a[sl(slice(None, -2))],
+                out=out[sl(slice(1, -1))])
+    out[sl(slice(1, -1))] /= (h * 2)
+    np.subtract(a[sl(slice(1, 2))], a[sl(slice(0, 1))],
+                out=out[sl(slice(0, 1))])
+    np.subtract(a[sl(slice(-1, None))], a[sl(slice(-2, -1))],
+                out=out[sl(slice(-1, None))])
+    out[sl(slice(0, 1))] /= h
+    out[sl(slice(-1, None))] /= h
+    return out
 
-    sph._min = sph._data[[l for l in range(sph._veclen)]]
-    sph._max = sph._data[[l for l in range(sph._veclen)]]
-    for i in range(1, dimSz):
-        for l in range(0, sph._veclen):
-            vals = sph._data[[i*sph._veclen+l for l in range(sph._veclen)]]
-            if ( sph._min[l] > vals[l] ):
-                sph._min[l] = vals[l]
-            elif ( sph._max[l] < vals[l] ):
-                sph._max[l] = vals[l]
-            continue # end of for(l)
-        continue # end of for(i)
-    return sph        
-    
 def vectorCurlPy(d: SPH.SPH) -> SPH.SPH:
     ''' vectorCurlPy
     ベクトルデータを持つSPHからベクトルの回転をベクトルとして持つSPHを生成する
-    (Python実装)
+    (numpyによるPython実装)
 
     Parameters
     ----------
@@ -178,103 +294,134 @@ def vectorCurlPy(d: SPH.SPH) -> SPH.SPH:
     sph._veclen = d._veclen
     sph._step = d._step
     sph._time = d._time
+    sph._dtype = d._dtype
+    if sph._dims[0] < 2 or sph._dims[1] < 2 or sph._dims[2] < 2:
+        return None
     if d._dtype == SPH.SPH.DT_DOUBLE:
-        sph._dtype = SPH.SPH.DT_DOUBLE
-        sph._data = np.array(0, dtype=np.float64)
+        ndt = np.float64
     else:
-        sph._dtype = SPH.SPH.DT_SINGLE
-        sph._data = np.array(0, dtype=np.float32)
-    dimSz = sph._dims[0] * sph._dims[1] * sph._dims[2]
-    if dimSz < 8:
+        ndt = np.float32
+
+    dd = d.dataIndexed()
+    u, v, w = dd[..., 0], dd[..., 1], dd[..., 2]
+    px, py, pz = [ndt(p) for p in sph._pitch]
+    td = np.empty(dd.shape, dtype=ndt)
+    t0 = np.empty(dd.shape[:3], dtype=ndt)
+    t1 = np.empty(dd.shape[:3], dtype=ndt)
+    # rot_x = dw/dy - dv/dz
+    np.subtract(_diff(w, 1, py, t0), _diff(v, 0, pz, t1), out=td[..., 0])
+    # rot_y = du/dz - dw/dx
+    np.subtract(_diff(u, 0, pz, t0), _diff(w, 2, px, t1), out=td[..., 1])
+    # rot_z = dv/dx - du/dy
+    np.subtract(_diff(v, 2, px, t0), _diff(u, 1, py, t1), out=td[..., 2])
+
+    sph._data = td.reshape((-1))
+    sph._calcMinMax()
+    return sph
+
+""" vortex identification fields of vortexFields (in calculation order) """
+VORTEX_FIELDS = ('Q', 'lambda2', 'helicity', 'vortmag')
+
+def _vortexPlane(dd: np.ndarray, k: int, pitch: [], names: []) -> []:
+    ''' _vortexPlane
+    Z方向のk番目の面について渦同定量を計算する(numpy実装)
+    '''
+    nz = dd.shape[0]
+    k0 = k - 1 if k > 0 else k
+    k1 = k + 1 if k < nz - 1 else k
+    plane = dd[k]
+    # velocity gradient tensor g[..., a, b] = d(u_a)/d(x_b)
+    g = np.empty(plane.shape[:2] + (3, 3), dtype=dd.dtype)
+    for a in range(3):
+        _diff(plane[..., a], 1, pitch[0], g[..., a, 0])
+        _diff(plane[..., a], 0, pitch[1], g[..., a, 1])
+        np.subtract(dd[k1, ..., a], dd[k0, ..., a], out=g[..., a, 2])
+        g[..., a, 2] /= pitch[2] * (k1 - k0)
+    w = np.stack((g[..., 2, 1] - g[..., 1, 2], g[..., 0, 2] - g[..., 2, 0],
+                  g[..., 1, 0] - g[..., 0, 1]), axis=-1)
+    res = []
+    for name in names:
+        if name == 'Q':
+            res.append(-0.5 * np.einsum('...ab,...ba->...', g, g))
+        elif name == 'lambda2':
+            gg = np.matmul(g, g)
+            m = 0.5 * (gg + np.swapaxes(gg, -1, -2))
+            res.append(np.linalg.eigvalsh(m)[..., 1])
+        elif name == 'helicity':
+            res.append(np.einsum('...i,...i->...', plane, w))
+        else:
+            res.append(np.sqrt(np.einsum('...i,...i->...', w, w)))
+    return res
+
+def vortexFields(d: SPH.SPH, fields: [] =('Q',),
+                 nthreads: int =0) -> {str: SPH.SPH}:
+    ''' vortexFields
+    ベクトル(速度)データを持つSPHから渦同定量のスカラーSPHを生成する
+    速度勾配テンソルを格子点ごとに一度だけ計算し、指定した量をまとめて求める
+    (C++実装、C++モジュールが無い場合はnumpy実装).
+
+    Parameters
+    ----------
+    d: SPH.SPH
+      vectorデータを持つSPHデータ
+    fields: str[]
+      計算する量のリスト. VORTEX_FIELDSの
+      'Q'(Q値), 'lambda2'(λ2), 'helicity'(ヘリシティ),
+      'vortmag'(渦度の大きさ)から指定する
+    nthreads: int
+      スレッド数(0の場合はsetNumThreadsの設定値)
+
+    Returns
+    -------
+    dict: 量の名前をキーとするスカラーSPHデータの辞書、None: 失敗
+    '''
+    if not d._veclen == 3 or d._data is None:
+        return None
+    if d._dims[0] < 2 or d._dims[1] < 2 or d._dims[2] < 2:
+        return None
+    for name in fields:
+        if name not in VORTEX_FIELDS:
+            return None
+    names = [name for name in VORTEX_FIELDS if name in fields]
+    if len(names) < 1:
         return None
-    sph._data.resize(dimSz * sph._veclen)
-
-    dim = sph._dims
-    dd = d._data
-    td = sph._data
-    for k in range(sph._dims[2]):
-        for j in range(sph._dims[1]):
-            for i in range(sph._dims[0]):
-                if i == 0:
-                    dvdx = (dd[(dim[0]*dim[1]*k +dim[0]*j +i+1)*3 +1] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3 +1]) / \
-                            sph._pitch[0]
-                    dwdx = (dd[(dim[0]*dim[1]*k +dim[0]*j +i+1)*3 +2] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3 +2]) / \
-                            sph._pitch[0]
-                elif i == dim[0] - 1:
-                    dvdx = (dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3 +1] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*j +i-1)*3 +1]) / \
-                            sph._pitch[0]
-                    dwdx = (dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3 +2] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*j +i-1)*3 +2]) / \
-                            sph._pitch[0]
-                else:
-                    dvdx = (dd[(dim[0]*dim[1]*k +dim[0]*j +i+1)*3 +1] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*j +i-1)*3 +1]) / \
-                            (sph._pitch[0] * 2)
-                    dwdx = (dd[(dim[0]*dim[1]*k +dim[0]*j +i+1)*3 +2] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*j +i-1)*3 +2]) / \
-                            (sph._pitch[0] * 2)
-                if j == 0:
-                    dudy = (dd[(dim[0]*dim[1]*k +dim[0]*(j+1) +i)*3] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3]) / \
-                            sph._pitch[1]
-                    dwdy = (dd[(dim[0]*dim[1]*k +dim[0]*(j+1) +i)*3 +2] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3 +2]) / \
-                            sph._pitch[1]
-                elif j == dim[1] - 1:
-                    dudy = (dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*(j-1) +i)*3]) / \
-                            sph._pitch[1]
-                    dwdy = (dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3 +2] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*(j-1) +i)*3 +2]) / \
-                            sph._pitch[1]
-                else:
-                    dudy = (dd[(dim[0]*dim[1]*k +dim[0]*(j+1) +i)*3] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*(j-1) +i)*3]) / \
-                            (sph._pitch[1] * 2)
-                    dwdy = (dd[(dim[0]*dim[1]*k +dim[0]*(j+1) +i)*3 +2] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*(j-1) +i)*3 +2]) / \
-                            (sph._pitch[1] * 2)
-                if k == 0:
-                    dudz = (dd[(dim[0]*dim[1]*(k+1) +dim[0]*j +i)*3] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3]) / \
-                            sph._pitch[2]
-                    dvdz = (dd[(dim[0]*dim[1]*(k+1) +dim[0]*j +i)*3 +1] - \
-                            dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3 +1]) / \
-                            sph._pitch[2]
-                elif k == dim[2] - 1:
-                    dudz = (dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3] - \
-                            dd[(dim[0]*dim[1]*(k-1) +dim[0]*j +i)*3]) / \
-                            sph._pitch[2]
-                    dvdz = (dd[(dim[0]*dim[1]*k +dim[0]*j +i)*3 +1] - \
-                            dd[(dim[0]*dim[1]*(k-1) +dim[0]*j +i)*3 +1]) / \
-                            sph._pitch[2]
-                else:
-                    dudz = (dd[(dim[0]*dim[1]*(k+1) +dim[0]*j +i)*3] - \
-                            dd[(dim[0]*dim[1]*(k-1) +dim[0]*j +i)*3]) / \
-                            (sph._pitch[2] * 2)
-                    dvdz = (dd[(dim[0]*dim[1]*(k+1) +dim[0]*j +i)*3 +1] - \
-                            dd[(dim[0]*dim[1]*(k-1) +dim[0]*j +i)*3 +1]) / \
-                            (sph._pitch[2] * 2)
-                td[(dim[0]*dim[1]*k + dim[0]*j + i)*3   ] = dwdy - dvdz
-                td[(dim[0]*dim[1]*k + dim[0]*j + i)*3 +1] = dudz - dwdx
-                td[(dim[0]*dim[1]*k + dim[0]*j + i)*3 +2] = dvdx - dudy
-                continue # end of for(i)
-            continue # end of for(j)
-        continue # end of for(i)
-
-    sph._min = sph._data[[l for l in range(sph._veclen)]]
-    sph._max = sph._data[[l for l in range(sph._veclen)]]
-    for i in range(1, dimSz):
-        for l in range(0, sph._veclen):
-            vals = sph._data[[i*sph._veclen+l for l in range(sph._veclen)]]
-            if ( sph._min[l] > vals[l] ):
-                sph._min[l] = vals[l]
-            elif ( sph._max[l] < vals[l] ):
-                sph._max[l] = vals[l]
-            continue # end of for(l)
-        continue # end of for(i)
-    return sph        
+    if d._dtype == SPH.SPH.DT_DOUBLE:
+        ndt = np.float64
+    else:
+        ndt = np.float32
+    # C-contiguous array of the exact type, so that the overload of ndt
+    # is selected (the kernel does not convert)
+    dd = np.ascontiguousarray(d.dataIndexed(), dtype=ndt)
+
+    if filter_exmod is not None:
+        flags = 0
+        for n, name in enumerate(VORTEX_FIELDS):
+            if name in names: flags |= (1 << n)
+        td, mn, mx = filter_exmod.calc_vortex(
+            dd, d._pitch[0], d._pitch[1], d._pitch[2], flags, nthreads)
+    else:
+        td = np.empty((len(names),) + dd.shape[:3], dtype=ndt)
+        for k in range(dd.shape[0]):
+            res = _vortexPlane(dd, k, d._pitch, names)
+            for f in range(len(names)):
+                td[f, k] = res[f]
+            continue # end of for(k)
+        mn = [td[f].min() for f in range(len(names))]
+        mx = [td[f].max() for f in range(len(names))]
 
+    res = {}
+    for f, name in enumerate(names):
+        sph = SPH.SPH()
+        sph._dims[:] = d._dims[:]
+        sph._org[:] = d._org[:]
+        sph._pitch[:] = d._pitch[:]
+        sph._veclen = 1
+        sph._step = d._step
+        sph._time = d._time
+        sph._dtype = d._dtype
+        sph._data = td[f].reshape((-1))
+        sph._min = [float(mn[f])]
+        sph._max = [float(mx[f])]
+        res[name] = sph
+        continue # end of for(f)
+    return res
@@ -6,68 +6,157 @@
 
 #include <pybind11/pybind11.h>
 #include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+#include <vector>
+#include <limits>
+#include <tuple>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
 namespace py = pybind11;
 
 
-// calc_curl
-//  calculate curl(rot) of vector sph data
-//  @param x: vector sph
+// set_num_threads
+//  set number of threads used by the kernels
+//  @param n: number of threads (<1: leave OpenMP default)
+inline void set_num_threads(int n) {
+#ifdef _OPENMP
+  if ( n > 0 ) omp_set_num_threads(n);
+#endif
+}
+
+// get_num_threads
+//  @return: number of threads used by the kernels
+inline int get_num_threads() {
+#ifdef _OPENMP
+  return omp_get_max_threads();
+#else
+  return 1;
+#endif
+}
+
+
+// curl_kernel
+//  calculate curl of contiguous (nz, ny, nx, 3) array, parallelized over
+//  k-slabs. one-sided difference at the edges, central difference inside.
+//  @param x, y: input / output buffer
+//  @param nz, ny, nx: grid size
 //  @param px, py, pz: pitch of grid
-//  @return: curl vector of sph
+//  @param mn, mx: min / max of each component of y (output)
+//  @param nthreads: number of threads (<1: default)
+
+template <typename T>
+void curl_kernel(const T* x, T* y, py::ssize_t nz, py::ssize_t ny,
+                 py::ssize_t nx, T px, T py, T pz, T mn[3], T mx[3],
+                 int nthreads) {
+  const py::ssize_t sy = nx * 3;
+  const py::ssize_t sz = ny * nx * 3;
+  for ( int c = 0; c < 3; c++ ) {
+    mn[c] = std::numeric_limits<T>::max();
+    mx[c] = std::numeric_limits<T>::lowest();
+  }
+#ifdef _OPENMP
+  if ( nthreads < 1 ) nthreads = omp_get_max_threads();
+#pragma omp parallel num_threads(nthreads)
+#endif
+  {
+    T lmn[3], lmx[3];
+    for ( int c = 0; c < 3; c++ ) {
+      lmn[c] = std::numeric_limits<T>::max();
+      lmx[c] = std::numeric_limits<T>::lowest();
+    }
+#ifdef _OPENMP
+#pragma omp for schedule(static)
+#endif
+    for ( py::ssize_t k = 0; k < nz; k++ ) {
+      const py::ssize_t k0 = (k == 0) ? k : k-1;
+      const py::ssize_t k1 = (k == nz-1) ? k : k+1;
+      const T dz = (k1 - k0 == 2) ? pz*2 : pz;
+      for ( py::ssize_t j = 0; j < ny; j++ ) {
+        const py::ssize_t j0 = (j == 0) ? j : j-1;
+        const py::ssize_t j1 = (j == ny-1) ? j : j+1;
+        const T dy = (j1 - j0 == 2) ? py*2 : py;
+        const T* xc = x + k*sz + j*sy;
+        const T* xj0 = x + k*sz + j0*sy;
+        const T* xj1 = x + k*sz + j1*sy;
+        const T* xk0 = x + k0*sz + j*sy;
+        const T* xk1 = x + k1*sz + j*sy;
+        T* yc = y + k*sz + j*sy;
+        for ( py::ssize_t i = 0; i < nx; i++ ) {
+          const py::ssize_t i0 = (i == 0) ? i : i-1;
+          const py::ssize_t i1 = (i == nx-1) ? i : i+1;
+          const T dx = (i1 - i0 == 2) ? px*2 : px;
+          const py::ssize_t o = i*3;
+          const T dvdx = (xc[i1*3+1] - xc[i0*3+1]) / dx;
+          const T dwdx = (xc[i1*3+2] - xc[i0*3+2]) / dx;
+          const T dudy = (xj1[o] - xj0[o]) / dy;
+          const T dwdy = (xj1[o+2] - xj0[o+2]) / dy;
+          const T dudz = (xk1[o] - xk0[o]) / dz;
+          const T dvdz = (xk1[o+1] - xk0[o+1]) / dz;
+          const T v[3] = {dwdy - dvdz, dudz - dwdx, dvdx - dudy};
+          for ( int c = 0; c < 3; c++ ) {
+            yc[o+c] = v[c];
+            if ( v[c] < lmn[c] ) lmn[c] = v[c];
+            if ( v[c] > lmx[c] ) lmx[c] = v[c];
+          }
+        } // end of for(i)
+      } // end of for(j)
+    } // end of for(k)
+#ifdef _OPENMP
+#pragma omp critical
+#endif
+    for ( int c = 0; c < 3; c++ ) {
+      if ( lmn[c] < mn[c] ) mn[c] = lmn[c];
+      if ( lmx[c] > mx[c] ) mx[c] = lmx[c];
+    }
+  }
+}
+
+
+// calc_curl_minmax
+//  calculate curl(rot) of vector sph data and min/max of each component
+//  @param x: vector sph, shape (nz, ny, nx, 3)
+//  @param px, py, pz: pitch of grid
+//  @param nthreads: number of threads (<1: default)
+//  @return: (curl vector of sph, [min], [max])
 
 template <typename T>
-py::array_t<T> calc_curl(py::array_t<T> x, T px, T py, T pz) {
+std::tuple<py::array_t<T>, std::vector<T>, std::vector<T>>
+calc_curl_minmax(py::array_t<T, py::array::c_style | py::array::forcecast> x,
+                 T px, T py, T pz, int nthreads) {
   const auto &info = x.request(); // struct{}
   const auto &shape = info.shape; // std::vector<ssize_t>
   py::array_t<T> y{shape};
+  std::vector<T> mn(3, T(0)), mx(3, T(0));
 
-  if ( shape.size() < 4 ||
-       shape[0] < 2 || shape[1] < 2 || shape[2] < 2 || shape[3] < 3 )
-    return y;
-
-  T dvdx, dwdx, dudy, dwdy, dudz, dvdz;
-  int i, j, k;
-  for ( k = 0; k < shape[0]; k++ )
-    for ( j = 0; j < shape[1]; j++ )
-      for ( i = 0; i < shape[2]; i++ ) {
-	if ( i == 0 ) {
-	  dvdx = (*x.data(k, j, i+1, 1) - *x.data(k, j, i, 1)) / px;
-	  dwdx = (*x.data(k, j, i+1, 2) - *x.data(k, j, i, 2)) / px;
-	} else if ( i == shape[2] - 1 ) {
-	  dvdx = (*x.data(k, j, i, 1) - *x.data(k, j, i-1, 1)) / px;
-	  dwdx = (*x.data(k, j, i, 2) - *x.data(k, j, i-1, 2)) / px;
-	} else {
-	  dvdx = (*x.data(k, j, i+1, 1) - *x.data(k, j, i-1, 1)) / (px*2);
-	  dwdx = (*x.data(k, j, i+1, 2) - *x.data(k, j, i-1, 2)) / (px*2);
-	}
-	if ( j == 0 ) {
-	  dudy = (*x.data(k, j+1, i, 0) - *x.data(k, j, i, 0)) / py;
-	  dwdy = (*x.data(k, j+1, i, 2) - *x.data(k, j, i, 2)) / py;
-	} else if ( j == shape[1] - 1 ) {
-	  dudy = (*x.data(k, j, i, 0) - *x.data(k, j-1, i, 0)) / py;
-	  dwdy = (*x.data(k, j, i, 2) - *x.data(k, j-1, i, 2)) / py;
-	} else {
-	  dudy = (*x.data(k, j+1, i, 0) - *x.data(k, j-1, i, 0)) / (py*2);
-	  dwdy = (*x.data(k, j+1, i, 2) - *x.data(k, j-1, i, 2)) / (py*2);
-	}
-	if ( k == 0 ) {
-	  dudz = (*x.data(k+1, j, i, 0) - *x.data(k, j, i, 0)) / pz;
-	  dvdz = (*x.data(k+1, j, i, 1) - *x.data(k, j, i, 1)) / pz;
-	} else if ( k == shape[0] - 1 ) {
-	  dudz = (*x.data(k, j, i, 0) - *x.data(k-1, j, i, 0)) / pz;
-	  dvdz = (*x.data(k, j, i, 1) - *x.data(k-1, j, i, 1)) / pz;
-	} else {
-	  dudz = (*x.data(k+1, j, i, 0) - *x.data(k-1, j, i, 0)) / (pz*2);
-	  dvdz = (*x.data(k+1, j, i, 1) - *x.data(k-1, j, i, 1)) / (pz*2);
-	}
-
-	*y.mutable_data(k, j, i, 0) = dwdy - dvdz;
-	*y.mutable_data(k, j, i, 1) = dudz - dwdx;
-	*y.mutable_data(k, j, i, 2) = dvdx - dudy;
-      } // end of for(i)
-
-  return y;
+  if ( shape.size() != 4 ||
+       shape[0] < 2 || shape[1] < 2 || shape[2] < 2 || shape[3] != 3 )
+    return std::make_tuple(y, mn, mx);
+
+  const T* xp = static_cast<const T*>(info.ptr);
+  T* yp = static_cast<T*>(y.request().ptr);
+  {
+    py::gil_scoped_release release;
+    curl_kernel<T>(xp, yp, shape[0], shape[1], shape[2], px, py, pz,
+                   mn.data(), mx.data(), nthreads);
+  }
+  return std::make_tuple(y, mn, mx);
+}
+
+
+// calc_curl
+//  calculate curl(rot) of vector sph data
+//  @param x: vector sph
+//  @param px, py, pz: pitch of grid
+//  @param nthreads: number of threads (<1: default)
+//  @return: curl vector of sph
+
+template <typename T>
+py::array_t<T> calc_curl(
+    py::array_t<T, py::array::c_style | py::array::forcecast> x,
+    T px, T py, T pz, int nthreads) {
+  return std::get<0>(calc_curl_minmax<T>(x, px, py, pz, nthreads));
 }
 
 #endif //  _VECROT_EXMOD_HPP_
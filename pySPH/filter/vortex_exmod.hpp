@@ -0,0 +1,219 @@
+/*
+  SPH filter external module
+ */
+#ifndef _VORTEX_EXMOD_HPP_
+#define _VORTEX_EXMOD_HPP_
+
+#include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+#include <vector>
+#include <limits>
+#include <tuple>
+#include <cmath>
+#include <utility>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+namespace py = pybind11;
+
+// field flags of calc_vortex
+enum {
+  VORTEX_Q        = 1,  // Q-criterion
+  VORTEX_LAMBDA2  = 2,  // lambda2
+  VORTEX_HELICITY = 4,  // helicity (u . omega)
+  VORTEX_VORTMAG  = 8,  // vorticity magnitude |omega|
+};
+
+
+// sym3_mid_eigen
+//  middle eigenvalue of symmetric 3x3 matrix (closed form)
+//  @param m: row-major 3x3 matrix
+//  @return: middle eigenvalue
+
+template <typename T>
+inline T sym3_mid_eigen(const T m[9]) {
+  const double p1 = double(m[1])*m[1] + double(m[2])*m[2]
+    + double(m[5])*m[5];
+  const double q = (double(m[0]) + m[4] + m[8]) / 3.0;
+  if ( p1 == 0.0 ) {
+    double a = m[0], b = m[4], c = m[8];
+    if ( a > b ) std::swap(a, b);
+    if ( b > c ) std::swap(b, c);
+    if ( a > b ) std::swap(a, b);
+    return T(b);
+  }
+  const double d0 = m[0] - q, d1 = m[4] - q, d2 = m[8] - q;
+  const double p2 = d0*d0 + d1*d1 + d2*d2 + 2.0*p1;
+  const double p = std::sqrt(p2 / 6.0);
+  const double b0 = d0/p, b4 = d1/p, b8 = d2/p;
+  const double b1 = m[1]/p, b2 = m[2]/p, b5 = m[5]/p;
+  double r = (b0*(b4*b8 - b5*b5) - b1*(b1*b8 - b5*b2)
+              + b2*(b1*b5 - b4*b2)) / 2.0;
+  if ( r < -1.0 ) r = -1.0;
+  else if ( r > 1.0 ) r = 1.0;
+  const double phi = std::acos(r) / 3.0;
+  const double e1 = q + 2.0*p*std::cos(phi);
+  const double e3 = q + 2.0*p*std::cos(phi + 2.0943951023931957); // 2pi/3
+  return T(3.0*q - e1 - e3);
+}
+
+
+// vortex_kernel
+//  calculate vortex identification fields of contiguous (nz, ny, nx, 3)
+//  array in a single pass, parallelized over k-slabs. the velocity gradient
+//  tensor is evaluated once per grid point (one-sided difference at the
+//  edges, central difference inside).
+//  @param x, y: input / output buffer, y is (nf, nz, ny, nx)
+//  @param nz, ny, nx: grid size
+//  @param px, py, pz: pitch of grid
+//  @param flags: OR of VORTEX_* flags, fields are stored in flag order
+//  @param mn, mx: min / max of each field (output)
+//  @param nthreads: number of threads (<1: default)
+
+template <typename T>
+void vortex_kernel(const T* x, T* y, py::ssize_t nz, py::ssize_t ny,
+                   py::ssize_t nx, T px, T py, T pz, int flags,
+                   T* mn, T* mx, int nthreads) {
+  const py::ssize_t sy = nx * 3;
+  const py::ssize_t sz = ny * nx * 3;
+  const py::ssize_t nn = nz * ny * nx;
+  int nf = 0;
+  int fl[4];
+  for ( int b = 0; b < 4; b++ )
+    if ( flags & (1 << b) ) fl[nf++] = (1 << b);
+  for ( int f = 0; f < nf; f++ ) {
+    mn[f] = std::numeric_limits<T>::max();
+    mx[f] = std::numeric_limits<T>::lowest();
+  }
+#ifdef _OPENMP
+  if ( nthreads < 1 ) nthreads = omp_get_max_threads();
+#pragma omp parallel num_threads(nthreads)
+#endif
+  {
+    T lmn[4], lmx[4];
+    for ( int f = 0; f < nf; f++ ) {
+      lmn[f] = std::numeric_limits<T>::max();
+      lmx[f] = std::numeric_limits<T>::lowest();
+    }
+#ifdef _OPENMP
+#pragma omp for schedule(static)
+#endif
+    for ( py::ssize_t k = 0; k < nz; k++ ) {
+      const py::ssize_t k0 = (k == 0) ? k : k-1;
+      const py::ssize_t k1 = (k == nz-1) ? k : k+1;
+      const T dz = (k1 - k0 == 2) ? pz*2 : pz;
+      for ( py::ssize_t j = 0; j < ny; j++ ) {
+        const py::ssize_t j0 = (j == 0) ? j : j-1;
+        const py::ssize_t j1 = (j == ny-1) ? j : j+1;
+        const T dy = (j1 - j0 == 2) ? py*2 : py;
+        const T* xc = x + k*sz + j*sy;
+        const T* xj0 = x + k*sz + j0*sy;
+        const T* xj1 = x + k*sz + j1*sy;
+        const T* xk0 = x + k0*sz + j*sy;
+        const T* xk1 = x + k1*sz + j*sy;
+        const py::ssize_t yo = (k*ny + j)*nx;
+        for ( py::ssize_t i = 0; i < nx; i++ ) {
+          const py::ssize_t i0 = (i == 0) ? i : i-1;
+          const py::ssize_t i1 = (i == nx-1) ? i : i+1;
+          const T dx = (i1 - i0 == 2) ? px*2 : px;
+          const py::ssize_t o = i*3;
+
+          // velocity gradient tensor g[a*3+b] = d(u_a)/d(x_b)
+          T g[9];
+          for ( int a = 0; a < 3; a++ ) {
+            g[a*3+0] = (xc[i1*3+a] - xc[i0*3+a]) / dx;
+            g[a*3+1] = (xj1[o+a] - xj0[o+a]) / dy;
+            g[a*3+2] = (xk1[o+a] - xk0[o+a]) / dz;
+          }
+          const T wx = g[7] - g[5];
+          const T wy = g[2] - g[6];
+          const T wz = g[3] - g[1];
+
+          T v[4];
+          for ( int f = 0; f < nf; f++ ) {
+            switch ( fl[f] ) {
+            case VORTEX_Q: {
+              // Q = (|Omega|^2 - |S|^2) / 2 = -(g_ab g_ba) / 2
+              T tr = 0;
+              for ( int a = 0; a < 3; a++ )
+                for ( int b = 0; b < 3; b++ )
+                  tr += g[a*3+b] * g[b*3+a];
+              v[f] = -tr / 2;
+              break;
+            }
+            case VORTEX_LAMBDA2: {
+              // middle eigenvalue of S^2 + Omega^2 = (g g + g^T g^T) / 2
+              T m[9];
+              for ( int a = 0; a < 3; a++ )
+                for ( int b = 0; b < 3; b++ ) {
+                  T s = 0;
+                  for ( int c = 0; c < 3; c++ )
+                    s += g[a*3+c] * g[c*3+b] + g[c*3+a] * g[b*3+c];
+                  m[a*3+b] = s / 2;
+                }
+              v[f] = sym3_mid_eigen<T>(m);
+              break;
+            }
+            case VORTEX_HELICITY:
+              v[f] = xc[o]*wx + xc[o+1]*wy + xc[o+2]*wz;
+              break;
+            default: // VORTEX_VORTMAG
+              v[f] = std::sqrt(wx*wx + wy*wy + wz*wz);
+              break;
+            }
+            y[f*nn + yo + i] = v[f];
+            if ( v[f] < lmn[f] ) lmn[f] = v[f];
+            if ( v[f] > lmx[f] ) lmx[f] = v[f];
+          }
+        } // end of for(i)
+      } // end of for(j)
+    } // end of for(k)
+#ifdef _OPENMP
+#pragma omp critical
+#endif
+    for ( int f = 0; f < nf; f++ ) {
+      if ( lmn[f] < mn[f] ) mn[f] = lmn[f];
+      if ( lmx[f] > mx[f] ) mx[f] = lmx[f];
+    }
+  }
+}
+
+
+// calc_vortex
+//  calculate vortex identification fields of vector sph data
+//  @param x: vector sph, shape (nz, ny, nx, 3)
+//  @param px, py, pz: pitch of grid
+//  @param flags: OR of VORTEX_* flags
+//  @param nthreads: number of threads (<1: default)
+//  @return: (fields (nf, nz, ny, nx) in flag order, [min], [max])
+
+template <typename T>
+std::tuple<py::array_t<T>, std::vector<T>, std::vector<T>>
+calc_vortex(py::array_t<T, py::array::c_style | py::array::forcecast> x,
+            T px, T py, T pz, int flags, int nthreads) {
+  const auto &info = x.request(); // struct{}
+  const auto &shape = info.shape; // std::vector<ssize_t>
+  int nf = 0;
+  for ( int b = 0; b < 4; b++ )
+    if ( flags & (1 << b) ) nf++;
+
+  if ( shape.size() != 4 || nf < 1 ||
+       shape[0] < 2 || shape[1] < 2 || shape[2] < 2 || shape[3] != 3 )
+    return std::make_tuple(py::array_t<T>(0), std::vector<T>(),
+                           std::vector<T>());
+
+  py::array_t<T> y({py::ssize_t(nf), shape[0], shape[1], shape[2]});
+  std::vector<T> mn(nf), mx(nf);
+  const T* xp = static_cast<const T*>(info.ptr);
+  T* yp = static_cast<T*>(y.request().ptr);
+  {
+    py::gil_scoped_release release;
+    vortex_kernel<T>(xp, yp, shape[0], shape[1], shape[2], px, py, pz,
+                     flags, mn.data(), mx.data(), nthreads);
+  }
+  return std::make_tuple(y, mn, mx);
+}
+
+#endif //  _VORTEX_EXMOD_HPP_
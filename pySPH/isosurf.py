@@ -6,23 +6,101 @@ SPH_isosurf
 
 import sys, os, typing
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from . import SPH
 from skimage import measure
 
 
+def _mcBlock(sub: np.ndarray, value: float, spc: tuple, ofs: tuple,
+             seamLo: tuple, seamHi: tuple):
+    ''' _mcBlock
+    ブロックに対してmarching cubesを実行する(プロセスプール用)
+
+    Parameters
+    ----------
+    sub: np.ndarray
+      ブロックのボリューム (Z, Y, X)
+    value: float
+      等値面の閾値
+    spc: tuple
+      格子間隔 (Z, Y, X)
+    ofs: tuple
+      ブロック原点の格子インデックス (Z, Y, X)
+    seamLo, seamHi: tuple
+      下側/上側の面が他のブロックと共有されているか (Z, Y, X)
+
+    Returns
+    -------
+    (頂点, 三角形, 法線, 継ぎ目上の頂点のマスク, 継ぎ目上の頂点の辺キー)、
+    等値面がない場合はNone。辺キーは(軸, 格子インデックス(Z, Y, X))で、
+    頂点が補間された格子辺(軸方向の下端の格子点)を全体の格子で表す。
+    格子点上の頂点の軸は3とする
+    '''
+    try:
+        vv, faces, nv, _ = measure.marching_cubes(sub, value, spacing=spc)
+    except (ValueError, RuntimeError):
+        return None
+    if len(faces) < 1:
+        return None
+    loc = vv.astype(np.float64) / spc
+    # 頂点座標の丸め誤差の許容値(格子単位)
+    eps = np.finfo(vv.dtype).eps * max(sub.shape) * 8
+    seam = np.zeros(len(vv), dtype=bool)
+    for a in range(3):
+        if seamLo[a]:
+            seam |= np.abs(loc[:, a]) < eps
+        if seamHi[a]:
+            seam |= np.abs(loc[:, a] - (sub.shape[a] - 1)) < eps
+        continue # end of for(a)
+
+    sl = loc[seam]
+    near = np.rint(sl)
+    dev = np.abs(sl - near)
+    ax = np.argmax(dev, axis=1)
+    row = np.arange(len(sl))
+    idx = near.astype(np.int64)
+    idx[row, ax] = np.floor(sl[row, ax]).astype(np.int64)
+    onPt = dev[row, ax] < eps
+    idx[onPt] = near[onPt].astype(np.int64)
+    ax[onPt] = 3
+    key = np.column_stack((ax, idx + np.array(ofs, dtype=np.int64)))
+
+    vv += np.array(ofs) * spc
+    return (vv, faces, nv, seam, key)
+
+
 class SPH_isosurf:
 
+    # ブロック分割時のデフォルトのブロックサイズ(格子点数)
+    BLOCK_SIZE = 128
+
+    # メッシュ出力時にまとめて処理する行数
+    WRITE_CHUNK = 65536
+
     @staticmethod
-    def generate(d: SPH.SPH, value: float) -> ([float], [int], [float]):
+    def generate(d: SPH.SPH, value: float, block=None, workers: int =1,
+                 index=None) -> ([float], [int], [float]):
         ''' generate
         スカラーのSPHデータに対して等値面を生成する(static method)
 
+        blockまたはworkers(>1)を指定した場合、ボリュームを1層ずつ重なる
+        ブロックに分割して等値面を生成し、ブロック境界で重複する頂点を
+        結合する(法線は平均する)。
+
         Parameters
         ----------
         d: SPH.SPH
           スカラーSPHデータ
         value: float
           等値面の閾値
+        block: int or (int, int, int)
+          ブロックの格子点数 (X, Y, Z)。Noneの場合、workers>1なら
+          BLOCK_SIZEで分割し、そうでなければ分割しない
+        workers: int
+          プロセスプールのワーカー数(デフォルト: 1、プールを使用しない)
+        index: SPH_minmaxIndex
+          ブロック毎のmin/maxインデックス。指定した場合、そのブロック分割で
+          閾値をまたぐブロックのみ処理する(blockは無視される)
 
         Returns
         -------
@@ -36,17 +114,217 @@ class SPH_isosurf:
         
         vol = d._data.reshape([d._dims[2], d._dims[1], d._dims[0]])
         spc = (d._pitch[2], d._pitch[1], d._pitch[0])
+        if index is not None:
+            if index.dims != list(d._dims):
+                return (None, None, None)
+            block = index.block
+        if block is None and workers > 1:
+            block = SPH_isosurf.BLOCK_SIZE
+        if block is not None:
+            return SPH_isosurf._generateBlocks(vol, spc, d._org, value,
+                                               block, workers, index)
+        if not vol.flags.writeable:
+            # marching_cubes requires writable buffer (e.g. mmap-ed data)
+            vol = np.array(vol)
         vv, faces, nv, _ = measure.marching_cubes(vol, value, spacing=spc)
         verts = vv[:, [2,1,0]] + d._org
         normals = nv[:, [2,1,0]]
 
         return (verts, faces, normals)
 
+    @staticmethod
+    def generateMulti(d: SPH.SPH, values: [float], block=None,
+                      workers: int =1, index=None,
+                      cache: bool =False) -> list:
+        ''' generateMulti
+        スカラーのSPHデータに対して複数の閾値の等値面を生成する
+        (static method)。ボリュームの準備、min/maxインデックス、
+        プロセスプールは閾値間で共有する
+
+        Parameters
+        ----------
+        d: SPH.SPH
+          スカラーSPHデータ
+        values: float[]
+          等値面の閾値のリスト
+        block, workers: generateと同じ
+        index: SPH_minmaxIndex
+          ブロック毎のmin/maxインデックス。Noneの場合、ブロック分割時は
+          メモリ上で作成する
+        cache: bool
+          Trueの場合、インデックスのキャッシュファイル(<ファイル名>.mmidx.npz)
+          を使用・作成する(デフォルト: False)
+
+        Returns
+        -------
+        (頂点, 三角形, 法線)のリスト(valuesの順)。等値面がない閾値は
+        空の配列となる
+        '''
+        if index is None: index = True
+        with SPH_isosurfSession(d, block, workers, index, cache) as ses:
+            return ses.generateMulti(values)
+
+    @staticmethod
+    def _blockRanges(dims: [int], block) -> [[(int, int)]]:
+        ''' _blockRanges
+        各軸のブロック範囲(格子点インデックス、終端を含む)を求める。
+        隣接ブロックは1層の格子点を共有する
+
+        Parameters
+        ----------
+        dims: int[]
+          ボリュームの格子点数 (Z, Y, X)
+        block: int or (int, int, int)
+          ブロックの格子点数 (X, Y, Z)
+
+        Returns
+        -------
+        [(int, int)]のリスト (Z, Y, X)
+        '''
+        if isinstance(block, int):
+            block = (block, block, block)
+        rngs = []
+        for a in range(3):
+            n = dims[a]
+            bs = max(2, int(block[2-a]))
+            lst = [(s, min(s + bs - 1, n - 1))
+                   for s in range(0, n - 1, bs - 1)]
+            rngs.append(lst)
+        return rngs
+
+    @staticmethod
+    def _generateBlocks(vol: np.ndarray, spc: tuple, org: [float],
+                        value: float, block, workers: int, index=None,
+                        executor=None):
+        ''' _generateBlocks
+        ブロック分割して等値面を生成し、継ぎ目の頂点を結合する。
+        indexを指定した場合、閾値をまたがないブロックは処理しない。
+        executorを指定した場合、新たにプロセスプールを作成せずに使用する
+        '''
+        rngs = SPH_isosurf._blockRanges(vol.shape, block)
+        act = None
+        if index is not None:
+            act = index.active(value)
+        args = []
+        for bk, zr in enumerate(rngs[0]):
+            for bj, yr in enumerate(rngs[1]):
+                for bi, xr in enumerate(rngs[2]):
+                    if act is not None and not act[bk, bj, bi]:
+                        continue
+                    r = (zr, yr, xr)
+                    args.append((
+                        tuple(r[a][0] for a in range(3)),
+                        tuple(r[a][0] > 0 for a in range(3)),
+                        tuple(r[a][1] < vol.shape[a] - 1 for a in range(3)),
+                        r))
+
+        def subVol(r):
+            return vol[r[0][0]:r[0][1]+1, r[1][0]:r[1][1]+1,
+                       r[2][0]:r[2][1]+1]
+
+        res = []
+        ex = executor
+        if ex is None and workers > 1:
+            ex = ProcessPoolExecutor(max_workers=workers)
+        if ex is not None:
+            try:
+                # 転送中のブロック数を制限してメモリを抑える
+                futs = []
+                for ofs, lo, hi, r in args:
+                    if len(futs) >= max(1, workers) * 2:
+                        res.append(futs.pop(0).result())
+                    futs.append(ex.submit(_mcBlock, np.array(subVol(r)),
+                                          value, spc, ofs, lo, hi))
+                    continue # end of for(args)
+                res.extend([f.result() for f in futs])
+            finally:
+                if executor is None:
+                    ex.shutdown()
+        else:
+            res = [_mcBlock(np.array(subVol(r)), value, spc, ofs, lo, hi)
+                   for ofs, lo, hi, r in args]
+        res = [x for x in res if x is not None]
+        return SPH_isosurf._weld(res, spc, org)
+
+    @staticmethod
+    def _weld(res: list, spc: tuple, org: [float]):
+        ''' _weld
+        ブロック毎の等値面を連結し、継ぎ目上の同じ格子辺の頂点を結合する
+
+        Parameters
+        ----------
+        res: list
+          _mcBlockの結果のリスト
+        spc: tuple
+          格子間隔 (Z, Y, X)
+        org: float[]
+          原点座標 (X, Y, Z)
+
+        Returns
+        -------
+        (頂点, 三角形, 法線)
+        '''
+        if len(res) < 1:
+            return (np.zeros((0, 3), dtype=np.float32),
+                    np.zeros((0, 3), dtype=np.int32),
+                    np.zeros((0, 3), dtype=np.float32))
+        nofs = np.cumsum([0] + [len(x[0]) for x in res])
+        vv = np.concatenate([x[0] for x in res])
+        nv = np.concatenate([x[2] for x in res])
+        seam = np.concatenate([x[3] for x in res])
+        faces = np.concatenate([x[1] + nofs[i] for i, x in enumerate(res)])
+
+        # 継ぎ目上の頂点を補間された格子辺で同一視する
+        n = len(vv)
+        rep = np.arange(n)
+        sidx = np.nonzero(seam)[0]
+        if len(sidx) > 0:
+            key = np.concatenate([x[4] for x in res])
+            _, first, inv = np.unique(key, axis=0, return_index=True,
+                                      return_inverse=True)
+            rep[sidx] = sidx[first][inv.reshape(-1)]
+        keep = rep == np.arange(n)
+        newId = np.cumsum(keep) - 1
+        faces = newId[rep][faces].astype(faces.dtype)
+
+        acc = np.zeros((n, 3), dtype=np.float64)
+        np.add.at(acc, rep, nv)
+        nrm = acc[keep]
+        ln = np.linalg.norm(nrm, axis=1)
+        ln[ln == 0] = 1.0
+        nrm = (nrm / ln[:, None]).astype(nv.dtype)
+
+        verts = vv[keep][:, [2,1,0]] + org
+        normals = nrm[:, [2,1,0]]
+        return (verts, faces, normals)
+
+    @staticmethod
+    def _floatFmt(a: np.ndarray) -> str:
+        ''' _floatFmt
+        配列の型に応じた実数の書式(単精度: %.9g、倍精度: %.17g)を返す
+        '''
+        if a.dtype == np.float32 or a.dtype.itemsize <= 4:
+            return '%.9g'
+        return '%.17g'
+
+    @staticmethod
+    def _writeRows(f: typing.IO, fmt: str, arr: np.ndarray):
+        ''' _writeRows
+        2次元配列の各行をfmtで書式化し、WRITE_CHUNK行ずつまとめて出力する
+        '''
+        for s in range(0, len(arr), SPH_isosurf.WRITE_CHUNK):
+            blk = arr[s:s+SPH_isosurf.WRITE_CHUNK]
+            f.write((fmt * len(blk)) % tuple(blk.ravel().tolist()))
+        return
+
     @staticmethod
     def saveOBJ(f: typing.IO, verts:[float], faces:[int], normals:[float]):
         ''' saveOBJ
         generateで生成された等値面をOBJファイルに出力する(static method)
 
+        頂点、法線、三角形はWRITE_CHUNK行ずつまとめて書式化する。
+        実数は単精度なら%.9g、倍精度なら%.17gで出力する
+
         Parameters
         ----------
         f: typing.IO
@@ -58,13 +336,453 @@ class SPH_isosurf:
         normals: float[]
           等値面の頂点の法線ベクトルリスト
         '''
+        verts = np.asarray(verts)
+        normals = np.asarray(normals)
+        faces = np.asarray(faces, dtype=np.int64)
         f.write('o SPH_isosurf\n')
-        for v in verts:
-            f.write('v {} {} {}\n'.format(*v))
-        for vn in normals:
-            f.write('vn {} {} {}\n'.format(*vn))
-        for tri in faces:
-            f.write('f {}//{} {}//{} {}//{}\n'.format(
-                tri[0]+1,tri[0]+1,tri[1]+1,tri[1]+1,tri[2]+1,tri[2]+1))
+        ff = SPH_isosurf._floatFmt(verts)
+        SPH_isosurf._writeRows(f, 'v %s %s %s\n' % (ff, ff, ff), verts)
+        ff = SPH_isosurf._floatFmt(normals)
+        SPH_isosurf._writeRows(f, 'vn %s %s %s\n' % (ff, ff, ff), normals)
+        for s in range(0, len(faces), SPH_isosurf.WRITE_CHUNK):
+            tri = faces[s:s+SPH_isosurf.WRITE_CHUNK] + 1
+            SPH_isosurf._writeRows(f, 'f %d//%d %d//%d %d//%d\n',
+                                   tri[:, [0,0,1,1,2,2]])
+        return
+
+    @staticmethod
+    def savePLY(f: typing.BinaryIO, verts:[float], faces:[int],
+                normals:[float] =None):
+        ''' savePLY
+        generateで生成された等値面をバイナリPLYファイル
+        (binary_little_endian)に出力する(static method)
+
+        頂点は単精度のx, y, z(と法線nx, ny, nz)、三角形はuchar個数と
+        int32の頂点インデックス3個で出力する
+
+        Parameters
+        ----------
+        f: typing.BinaryIO
+          PLYファイル(バイナリモード)
+        verts: float[]
+          等値面の頂点リスト
+        faces: int[]
+          等値面の三角形の頂点リスト
+        normals: float[]
+          等値面の頂点の法線ベクトルリスト(Noneの場合は出力しない)
+        '''
+        verts = np.asarray(verts)
+        faces = np.asarray(faces)
+        vdt = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+        if normals is not None:
+            normals = np.asarray(normals)
+            vdt += [('nx', '<f4'), ('ny', '<f4'), ('nz', '<f4')]
+        vdt = np.dtype(vdt)
+        fdt = np.dtype([('n', 'u1'), ('idx', '<i4', (3,))])
+
+        hdr = ['ply', 'format binary_little_endian 1.0',
+               'comment SPH_isosurf',
+               'element vertex %d' % len(verts),
+               'property float x', 'property float y', 'property float z']
+        if normals is not None:
+            hdr += ['property float nx', 'property float ny',
+                    'property float nz']
+        hdr += ['element face %d' % len(faces),
+                'property list uchar int vertex_indices', 'end_header']
+        f.write(('\n'.join(hdr) + '\n').encode('ascii'))
+
+        for s in range(0, len(verts), SPH_isosurf.WRITE_CHUNK):
+            vv = verts[s:s+SPH_isosurf.WRITE_CHUNK]
+            buf = np.empty(len(vv), dtype=vdt)
+            buf['x'], buf['y'], buf['z'] = vv[:, 0], vv[:, 1], vv[:, 2]
+            if normals is not None:
+                nv = normals[s:s+SPH_isosurf.WRITE_CHUNK]
+                buf['nx'], buf['ny'], buf['nz'] = \
+                    nv[:, 0], nv[:, 1], nv[:, 2]
+            f.write(buf.data)
+        for s in range(0, len(faces), SPH_isosurf.WRITE_CHUNK):
+            tri = faces[s:s+SPH_isosurf.WRITE_CHUNK]
+            buf = np.empty(len(tri), dtype=fdt)
+            buf['n'] = 3
+            buf['idx'] = tri
+            f.write(buf.data)
+        return
+
+    @staticmethod
+    def saveSTL(f: typing.BinaryIO, verts:[float], faces:[int],
+                normals:[float] =None):
+        ''' saveSTL
+        generateで生成された等値面をバイナリSTLファイルに出力する
+        (static method)
+
+        三角形の法線は頂点座標の外積から求める(normalsは使用しない)
+
+        Parameters
+        ----------
+        f: typing.BinaryIO
+          STLファイル(バイナリモード)
+        verts: float[]
+          等値面の頂点リスト
+        faces: int[]
+          等値面の三角形の頂点リスト
+        normals: float[]
+          等値面の頂点の法線ベクトルリスト(saveOBJ等との互換のため)
+        '''
+        verts = np.asarray(verts)
+        faces = np.asarray(faces)
+        tdt = np.dtype([('n', '<f4', (3,)), ('v', '<f4', (3, 3)),
+                        ('attr', '<u2')])
+        f.write(b'SPH_isosurf'.ljust(80, b' '))
+        f.write(np.array([len(faces)], dtype='<u4').tobytes())
+        for s in range(0, len(faces), SPH_isosurf.WRITE_CHUNK):
+            tv = verts[faces[s:s+SPH_isosurf.WRITE_CHUNK]]
+            fn = np.cross(tv[:, 1] - tv[:, 0], tv[:, 2] - tv[:, 0])
+            ln = np.linalg.norm(fn, axis=1)
+            ln[ln == 0] = 1.0
+            buf = np.empty(len(tv), dtype=tdt)
+            buf['n'] = fn / ln[:, None]
+            buf['v'] = tv
+            buf['attr'] = 0
+            f.write(buf.data)
+        return
+
+class SPH_isosurfSession:
+    ''' SPH_isosurfSession
+    等値面生成の準備(ボリュームの整形、min/maxインデックス、
+    プロセスプール)を保持し、閾値を変えた等値面の生成を繰り返す
+    '''
+
+    def __init__(self, d: SPH.SPH, block=None, workers: int =1,
+                 index=True, cache: bool =False):
+        ''' __init__
+
+        Parameters
+        ----------
+        d: SPH.SPH
+          スカラーSPHデータ
+        block: int or (int, int, int)
+          ブロックの格子点数 (X, Y, Z)。Noneの場合、workers>1なら
+          SPH_isosurf.BLOCK_SIZEで分割し、そうでなければ分割しない
+        workers: int
+          プロセスプールのワーカー数(デフォルト: 1)
+        index: SPH_minmaxIndex or bool
+          ブロック分割時に使用するmin/maxインデックス。Trueの場合
+          SPH_minmaxIndex.forSPHで作成する(デフォルト: True)
+        cache: bool
+          Trueの場合、インデックスのキャッシュファイルを使用・作成する
+          (デフォルト: False、メモリ上でのみ作成する)
+        '''
+        dimSz = d._dims[0] * d._dims[1] * d._dims[2]
+        if dimSz < 8 or d._veclen != 1:
+            raise ValueError('SPH_isosurfSession: scalar SPH data required')
+        self._org = list(d._org)
+        self._spc = (d._pitch[2], d._pitch[1], d._pitch[0])
+        self._workers = workers
+        self._executor = None
+        self._index = None
+        vol = d._data.reshape([d._dims[2], d._dims[1], d._dims[0]])
+        if isinstance(index, SPH_minmaxIndex):
+            block = index.block
+        if block is None and workers > 1:
+            block = SPH_isosurf.BLOCK_SIZE
+        self._block = block
+        if block is None:
+            if not vol.flags.writeable:
+                vol = np.array(vol)
+            self._range = (float(vol.min()), float(vol.max()))
+        else:
+            if isinstance(index, SPH_minmaxIndex):
+                self._index = index
+            elif index:
+                self._index = SPH_minmaxIndex.forSPH(d, block, cache)
+            if self._index is not None:
+                self._range = (float(self._index.min.min()),
+                               float(self._index.max.max()))
+            else:
+                self._range = (float(vol.min()), float(vol.max()))
+        self._vol = vol
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def range(self):
+        ''' データの(最小値, 最大値) '''
+        return self._range
+
+    def close(self):
+        ''' close
+        プロセスプールを終了する
+        '''
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._executor = None
         return
-    
+
+    def hasSurface(self, value: float) -> bool:
+        ''' hasSurface
+        閾値で等値面が生成されるかを返す
+
+        Parameters
+        ----------
+        value: float
+          等値面の閾値
+
+        Returns
+        -------
+        bool: 等値面が生成される可能性があればTrue
+        '''
+        if self._index is not None:
+            return self._index.hasSurface(value)
+        return self._range[0] < value < self._range[1]
+
+    def generate(self, value: float) -> ([float], [int], [float]):
+        ''' generate
+        閾値の等値面を生成する
+
+        Parameters
+        ----------
+        value: float
+          等値面の閾値
+
+        Returns
+        -------
+        float[]: 等値面の頂点リスト
+        int[]: 等値面の三角形の頂点リスト
+        float[]: 等値面の頂点の法線ベクトルリスト
+        (等値面がない場合はいずれも空の配列)
+        '''
+        if not self.hasSurface(value):
+            return SPH_isosurf._weld([], self._spc, self._org)
+        if self._block is None:
+            try:
+                vv, faces, nv, _ = measure.marching_cubes(
+                    self._vol, value, spacing=self._spc)
+            except (ValueError, RuntimeError):
+                return SPH_isosurf._weld([], self._spc, self._org)
+            return (vv[:, [2,1,0]] + self._org, faces, nv[:, [2,1,0]])
+        if self._executor is None and self._workers > 1:
+            self._executor = ProcessPoolExecutor(max_workers=self._workers)
+        return SPH_isosurf._generateBlocks(
+            self._vol, self._spc, self._org, value, self._block,
+            self._workers, self._index, self._executor)
+
+    def generateMulti(self, values: [float]) -> list:
+        ''' generateMulti
+        複数の閾値の等値面を生成する
+
+        Parameters
+        ----------
+        values: float[]
+          等値面の閾値のリスト
+
+        Returns
+        -------
+        (頂点, 三角形, 法線)のリスト(valuesの順)
+        '''
+        return [self.generate(v) for v in values]
+
+
+class SPH_minmaxIndex:
+    ''' SPH_minmaxIndex
+    スカラーSPHデータのブロック(1層ずつ重なる、SPH_isosurf.generateの
+    ブロック分割と同じ)毎のmin/maxインデックス
+    '''
+
+    # キャッシュファイルの拡張子
+    CACHE_EXT = '.mmidx.npz'
+
+    def __init__(self):
+        self._dims = [0, 0, 0]
+        self._block = [0, 0, 0]
+        self._min = None
+        self._max = None
+        return
+
+    @property
+    def dims(self):
+        return self._dims
+
+    @property
+    def block(self):
+        return self._block
+
+    @property
+    def min(self):
+        return self._min
+
+    @property
+    def max(self):
+        return self._max
+
+    @staticmethod
+    def build(d: SPH.SPH, block=None):
+        ''' build
+        SPHデータのブロック毎のmin/maxを求める(static method)。
+        Z方向のブロック毎にデータを参照するため、mmapで読み込んだ
+        データにも使用できる
+
+        Parameters
+        ----------
+        d: SPH.SPH
+          スカラーSPHデータ
+        block: int or (int, int, int)
+          ブロックの格子点数 (X, Y, Z)(デフォルト: SPH_isosurf.BLOCK_SIZE)
+
+        Returns
+        -------
+        SPH_minmaxIndex: 作成したインデックス、失敗した場合はNone
+        '''
+        if d is None or d._data is None or d._veclen != 1:
+            return None
+        if block is None:
+            block = SPH_isosurf.BLOCK_SIZE
+        if isinstance(block, int):
+            block = (block, block, block)
+        vol = d._data.reshape([d._dims[2], d._dims[1], d._dims[0]])
+        if min(vol.shape) < 2:
+            return None
+        rngs = SPH_isosurf._blockRanges(vol.shape, block)
+        shp = (len(rngs[0]), len(rngs[1]), len(rngs[2]))
+        bmin = np.empty(shp, dtype=np.float64)
+        bmax = np.empty(shp, dtype=np.float64)
+        for bk, zr in enumerate(rngs[0]):
+            slab = np.asarray(vol[zr[0]:zr[1]+1])
+            for bj, yr in enumerate(rngs[1]):
+                for bi, xr in enumerate(rngs[2]):
+                    sub = slab[:, yr[0]:yr[1]+1, xr[0]:xr[1]+1]
+                    bmin[bk, bj, bi] = sub.min()
+                    bmax[bk, bj, bi] = sub.max()
+            continue # end of for(bk)
+
+        idx = SPH_minmaxIndex()
+        idx._dims = list(d._dims)
+        idx._block = [int(b) for b in block]
+        idx._min = bmin
+        idx._max = bmax
+        return idx
+
+    def active(self, value: float) -> np.ndarray:
+        ''' active
+        閾値をまたぐブロックのマスクを返す
+
+        Parameters
+        ----------
+        value: float
+          等値面の閾値
+
+        Returns
+        -------
+        np.ndarray: ブロック毎のbool配列 (Z, Y, X)
+        '''
+        return (self._min <= value) & (value <= self._max) \
+            & (self._min < self._max)
+
+    def hasSurface(self, value: float) -> bool:
+        ''' hasSurface
+        閾値で等値面が生成されるかを返す
+
+        Parameters
+        ----------
+        value: float
+          等値面の閾値
+
+        Returns
+        -------
+        bool: 閾値をまたぐブロックがあればTrue
+        '''
+        return bool(self.active(value).any())
+
+    def save(self, path: str) -> bool:
+        ''' save
+        インデックスをnpzファイルに出力する
+
+        Parameters
+        ----------
+        path: str
+          出力ファイルのパス
+
+        Returns
+        -------
+        bool: 成功した場合True
+        '''
+        try:
+            with open(path, 'wb') as f:
+                np.savez(f, dims=np.array(self._dims),
+                         block=np.array(self._block),
+                         min=self._min, max=self._max)
+        except:
+            return False
+        return True
+
+    @staticmethod
+    def load(path: str):
+        ''' load
+        npzファイルからインデックスを読み込む(static method)
+
+        Parameters
+        ----------
+        path: str
+          入力ファイルのパス
+
+        Returns
+        -------
+        SPH_minmaxIndex: 読み込んだインデックス、失敗した場合はNone
+        '''
+        try:
+            with np.load(path) as z:
+                idx = SPH_minmaxIndex()
+                idx._dims = [int(x) for x in z['dims']]
+                idx._block = [int(x) for x in z['block']]
+                idx._min = z['min']
+                idx._max = z['max']
+        except:
+            return None
+        return idx
+
+    @staticmethod
+    def forSPH(d: SPH.SPH, block=None, cache: bool =False):
+        ''' forSPH
+        SPHデータのインデックスを返す(static method)。
+        cacheがTrueでSPHデータがファイルから読み込まれている場合、
+        <ファイル名>.mmidx.npzを再利用し、なければ作成して保存する
+
+        Parameters
+        ----------
+        d: SPH.SPH
+          スカラーSPHデータ
+        block: int or (int, int, int)
+          ブロックの格子点数 (X, Y, Z)(デフォルト: SPH_isosurf.BLOCK_SIZE)
+        cache: bool
+          キャッシュファイルを使用する(デフォルト: False)
+
+        Returns
+        -------
+        SPH_minmaxIndex: インデックス、失敗した場合はNone
+        '''
+        if block is None:
+            block = SPH_isosurf.BLOCK_SIZE
+        if isinstance(block, int):
+            block = (block, block, block)
+        cpath = None
+        if cache and d._path is not None and os.path.exists(d._path):
+            cpath = d._path + SPH_minmaxIndex.CACHE_EXT
+            if os.path.exists(cpath) and \
+               os.path.getmtime(cpath) >= os.path.getmtime(d._path):
+                idx = SPH_minmaxIndex.load(cpath)
+                if idx is not None and idx._dims == list(d._dims) and \
+                   idx._block == [int(b) for b in block]:
+                    return idx
+        idx = SPH_minmaxIndex.build(d, block)
+        if idx is not None and cpath is not None:
+            idx.save(cpath)
+        return idx
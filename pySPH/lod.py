@@ -0,0 +1,283 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+multi-resolution pyramid (level of detail) of .sph files
+"""
+from __future__ import print_function
+import os
+import struct
+import numpy
+from . import SPH
+
+
+class SPHPyramid:
+    """
+    Mip-style pyramid of downsampled SPH data.
+    level n is reduced by 2^n along each axis (axes of size 1 are kept)
+    and stored next to the source file as <base>.lod<n>.<method>.sphlod
+    (.sph format; the extension keeps the levels out of '*.sph' globs).
+    """
+
+    """ reduction methods """
+    METHODS = ('mean', 'min', 'max')
+
+    """ file extension of level files """
+    LEVEL_EXT = '.sphlod'
+
+    @staticmethod
+    def levelPath(path, level, method='mean'):
+        """
+        file path of a pyramid level
+         @param path: file path of the source .sph file
+         @param level: pyramid level (0 for the source itself)
+         @param method: reduction method of the level(default='mean')
+         @returns: file path
+        """
+        if level < 1: return path
+        base, _ = os.path.splitext(path)
+        return '%s.lod%d.%s%s' % (base, level, method, SPHPyramid.LEVEL_EXT)
+
+    @staticmethod
+    def _factors(dims, factor):
+        """
+        reduction factor of each axis, 1 for axes of size 1
+        """
+        return [factor if dims[a] > 1 else 1 for a in range(3)]
+
+    @staticmethod
+    def levelDims(dims, level):
+        """
+        grid size of a pyramid level
+         @param dims: grid size (X, Y, Z) of the source
+         @param level: pyramid level
+         @returns: grid size (X, Y, Z)
+        """
+        dims = list(dims)
+        for _ in range(level):
+            fac = SPHPyramid._factors(dims, 2)
+            dims = [(dims[a] + fac[a] - 1) // fac[a] for a in range(3)]
+        return dims
+
+    @staticmethod
+    def _reducedHeader(sph, fac):
+        """
+        SPH.SPH (no data) with geometry of sph reduced by fac.
+        each reduced point lies at the center of its block.
+        """
+        d = SPH.SPH()
+        d._dims = [(sph._dims[a] + fac[a] - 1) // fac[a] for a in range(3)]
+        d._org = [sph._org[a] + sph._pitch[a] * (fac[a] - 1) * 0.5
+                  for a in range(3)]
+        d._pitch = [sph._pitch[a] * fac[a] for a in range(3)]
+        d._dtype = sph._dtype
+        d._veclen = sph._veclen
+        d._step = sph._step
+        d._time = sph._time
+        d._min = None
+        d._max = None
+        return d
+
+    @staticmethod
+    def _reduceSlab(vol, fac, method):
+        """
+        reduce blocks of a slab. Y and X are padded by repeating the edge.
+         @param vol: numpy.ndarray of shape (z, y, x, veclen), z is a
+                     multiple of fac[2]
+         @param fac: reduction factor (X, Y, Z)
+         @param method: 'mean', 'min' or 'max'. for vector data min/max
+                        select the vector of min/max magnitude in a block.
+         @returns: numpy.ndarray of shape (z', y', x', veclen)
+        """
+        nz, ny, nx, vl = vol.shape
+        py = -ny % fac[1]
+        px = -nx % fac[0]
+        if py or px:
+            vol = numpy.pad(vol, ((0, 0), (0, py), (0, px), (0, 0)),
+                            mode='edge')
+        oz, oy, ox = nz // fac[2], (ny + py) // fac[1], (nx + px) // fac[0]
+        b = vol.reshape((oz, fac[2], oy, fac[1], ox, fac[0], vl))
+        if method == 'mean':
+            return b.mean(axis=(1, 3, 5), dtype=numpy.float64)
+        if vl == 1:
+            if method == 'min': return b.min(axis=(1, 3, 5))
+            return b.max(axis=(1, 3, 5))
+        b = b.transpose((0, 2, 4, 1, 3, 5, 6)).reshape((oz, oy, ox, -1, vl))
+        mag = numpy.square(b, dtype=numpy.float64).sum(axis=-1)
+        if method == 'min':
+            idx = mag.argmin(axis=3)
+        else:
+            idx = mag.argmax(axis=3)
+        sel = numpy.take_along_axis(b, idx[..., None, None], axis=3)
+        return sel[..., 0, :]
+
+    @staticmethod
+    def _slabs(sph, fac):
+        """
+        generate reduced slabs of sph, reading about IO_CHUNK bytes of
+        source planes at a time. Z is padded by repeating the last plane.
+        """
+        dims = sph._dims
+        vl = sph._veclen
+        vol = sph._data.reshape((dims[2], dims[1], dims[0], vl))
+        planeSz = dims[1] * dims[0] * vl * vol.itemsize
+        nin = max(1, SPH.SPH.IO_CHUNK // max(1, planeSz) // fac[2]) * fac[2]
+        for z0 in range(0, dims[2], nin):
+            sub = vol[z0:z0+nin]
+            pz = -sub.shape[0] % fac[2]
+            if pz:
+                sub = numpy.pad(sub, ((0, pz), (0, 0), (0, 0), (0, 0)),
+                                mode='edge')
+            yield sub
+        return
+
+    @staticmethod
+    def downsample(sph, factor=2, method='mean'):
+        """
+        downsample SPH data in memory
+         @param sph: SPH.SPH (the data may be memory-mapped)
+         @param factor: reduction factor of each axis(default=2)
+         @param method: 'mean', 'min' or 'max'(default='mean')
+         @returns: SPH.SPH, or None for failed.
+        """
+        if sph is None or sph._data is None: return None
+        if method not in SPHPyramid.METHODS: return None
+        fac = SPHPyramid._factors(sph._dims, factor)
+        d = SPHPyramid._reducedHeader(sph, fac)
+        ndt = sph._data.dtype.newbyteorder('=')
+        d._data = numpy.concatenate(
+            [SPHPyramid._reduceSlab(s, fac, method).astype(ndt).reshape((-1))
+             for s in SPHPyramid._slabs(sph, fac)])
+        d._calcMinMax()
+        return d
+
+    @staticmethod
+    def _writeLevel(sph, path, method):
+        """
+        reduce sph by 2 and write it to a .sph file slab by slab
+         @returns: True for succeed or False for failed.
+        """
+        fac = SPHPyramid._factors(sph._dims, 2)
+        d = SPHPyramid._reducedHeader(sph, fac)
+        if d._dtype == SPH.SPH.DT_DOUBLE:
+            ndt = numpy.dtype('=f8')
+        else:
+            ndt = numpy.dtype('=f4')
+        recSz = d._dims[0] * d._dims[1] * d._dims[2] * d._veclen \
+                * ndt.itemsize
+        chunk = max(1, SPH.SPH.IO_CHUNK // ndt.itemsize)
+        try:
+            ofp = open(path, 'wb')
+        except:
+            print("SPHPyramid: open failed: %s" % path)
+            return False
+        try:
+            d._writeHeader(ofp)
+            ofp.write(struct.pack('i', recSz))
+            for s in SPHPyramid._slabs(sph, fac):
+                r = SPHPyramid._reduceSlab(s, fac, method)
+                SPH.SPH._writeArray(ofp, r.reshape((-1)), ndt, chunk)
+            ofp.write(struct.pack('i', recSz))
+        except Exception as e:
+            print("SPHPyramid: write failed: %s: %s" % (path, e))
+            ofp.close()
+            return False
+        ofp.close()
+        return True
+
+    @staticmethod
+    def _isValid(path, level, srcDims, srcMtime):
+        """
+        check a level file exists, is newer than the source and has the
+        expected grid size
+        """
+        try:
+            if os.path.getmtime(path) < srcMtime: return False
+        except OSError:
+            return False
+        hd = SPH.SPH()
+        if not hd.loadHeader(path): return False
+        return hd._dims == SPHPyramid.levelDims(srcDims, level)
+
+    @staticmethod
+    def build(path, levels=3, method='mean', rebuild=False):
+        """
+        build pyramid levels 1..levels of a .sph file. each level is made
+        from the previous one through a memory map, so peak memory is
+        bounded by the slab size.
+         @param path: file path of the source .sph file
+         @param levels: number of levels(default=3, i.e. 2x, 4x, 8x)
+         @param method: 'mean', 'min' or 'max'(default='mean')
+         @param rebuild: rebuild valid existing levels(default=False)
+         @returns: list of level file paths, or None for failed.
+        """
+        if method not in SPHPyramid.METHODS:
+            print("SPHPyramid.build: unknown method: %s" % method)
+            return None
+        src = SPH.SPH()
+        if not src.loadHeader(path): return None
+        srcDims = list(src._dims)
+        srcMtime = os.path.getmtime(path)
+        prev = path
+        res = []
+        for lv in range(1, levels + 1):
+            lpath = SPHPyramid.levelPath(path, lv, method)
+            if rebuild or \
+               not SPHPyramid._isValid(lpath, lv, srcDims, srcMtime):
+                rebuild = True  # coarser levels depend on this one
+                sph = SPH.SPH()
+                if not sph.load(prev, mmap=True): return None
+                if not SPHPyramid._writeLevel(sph, lpath, method):
+                    return None
+                sph = None
+            res.append(lpath)
+            prev = lpath
+            continue # end of for(lv)
+        return res
+
+    @staticmethod
+    def selectLevel(dims, request):
+        """
+        coarsest level whose grid size meets the requested resolution
+         @param dims: grid size (X, Y, Z) of the source
+         @param request: requested grid size, int or (X, Y, Z)
+         @returns: pyramid level
+        """
+        if isinstance(request, int): request = (request,) * 3
+        need = [min(request[a], dims[a]) for a in range(3)]
+        lv = 0
+        while True:
+            ld = SPHPyramid.levelDims(dims, lv + 1)
+            if ld == SPHPyramid.levelDims(dims, lv): break
+            if any(ld[a] < need[a] for a in range(3)): break
+            lv += 1
+        return lv
+
+    @staticmethod
+    def loadPreview(path, request=256, build=False, method='mean',
+                    mmap=False):
+        """
+        load the coarsest pyramid level that meets the requested resolution.
+        if that level is not available (and build is False), the nearest
+        finer valid level, or the source itself, is loaded.
+         @param path: file path of the source .sph file
+         @param request: requested grid size, int or (X, Y, Z)(default=256)
+         @param build: build missing levels(default=False)
+         @param method: reduction method of the levels(default='mean')
+         @param mmap: load with SPH.load(mmap=True)(default=False)
+         @returns: SPH.SPH, or None for failed.
+        """
+        if method not in SPHPyramid.METHODS: return None
+        src = SPH.SPH()
+        if not src.loadHeader(path): return None
+        lv = SPHPyramid.selectLevel(src._dims, request)
+        if lv > 0 and build:
+            if SPHPyramid.build(path, lv, method) is None: return None
+        srcMtime = os.path.getmtime(path)
+        while lv > 0:
+            lpath = SPHPyramid.levelPath(path, lv, method)
+            if SPHPyramid._isValid(lpath, lv, src._dims, srcMtime): break
+            lv -= 1
+        sph = SPH.SPH()
+        if not sph.load(SPHPyramid.levelPath(path, lv, method), mmap=mmap):
+            return None
+        return sph
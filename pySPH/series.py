@@ -0,0 +1,241 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+time series of .sph files for Sphere framework
+"""
+from __future__ import print_function
+import glob
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from . import SPH
+
+
+class SPHSeries:
+    """
+    Ordered set of .sph files loaded lazily, with a byte-budgeted LRU cache
+    and background prefetch of the following steps
+    """
+
+    def __init__(self, paths, cacheBytes=1024*1024*1024, prefetch=2,
+                 mmap=False):
+        """
+        class initializer
+         @param paths: list of .sph file paths, or glob pattern string.
+                       a glob pattern is expanded in sorted order.
+         @param cacheBytes: byte budget of the decoded data cache
+                            (default=1GiB). the most recently used step is
+                            always kept even if it exceeds the budget.
+         @param prefetch: number of following steps to load in background
+                          (default=2, 0 for no prefetch)
+         @param mmap: load with SPH.load(mmap=True)(default=False)
+        """
+        if isinstance(paths, str):
+            self._paths = sorted(glob.glob(paths))
+        else:
+            self._paths = list(paths)
+        self._cacheBytes = cacheBytes
+        self._prefetch = prefetch
+        self._mmap = mmap
+        self._cache = collections.OrderedDict()
+        self._ready = collections.OrderedDict()
+        self._cacheUsed = 0
+        self._pending = {}
+        self._lock = threading.RLock()
+        self._executor = None
+        return
+
+    @property
+    def paths(self):
+        return self._paths
+
+    @property
+    def cacheBytes(self):
+        return self._cacheBytes
+    @cacheBytes.setter
+    def cacheBytes(self, v:int):
+        with self._lock:
+            self._cacheBytes = v
+            self._evict()
+
+    @property
+    def cacheUsed(self):
+        return self._cacheUsed
+
+    @property
+    def prefetch(self):
+        return self._prefetch
+    @prefetch.setter
+    def prefetch(self, v:int):
+        self._prefetch = v
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __getitem__(self, idx):
+        return self.get(idx)
+
+    def __iter__(self):
+        for i in range(len(self._paths)):
+            yield self.get(i)
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def _load(self, idx):
+        """
+        load idx-th step (called in background thread for prefetch)
+         @param idx: step index
+         @returns: SPH.SPH, or None for failed.
+        """
+        sph = SPH.SPH()
+        if not sph.load(self._paths[idx], mmap=self._mmap):
+            return None
+        return sph
+
+    @staticmethod
+    def _nbytes(sph):
+        """
+        bytes of decoded data held by sph
+        """
+        if sph is None or sph._data is None: return 0
+        return sph._data.nbytes
+
+    def _evict(self):
+        """
+        drop least recently used steps until the cache fits in the budget.
+        prefetched steps not yet consumed by get() are dropped only if the
+        budget can not be met otherwise, the farthest one first.
+        caller must hold the lock.
+        """
+        while self._cacheUsed > self._cacheBytes and len(self._cache) > 1:
+            _, sph = self._cache.popitem(last=False)
+            self._cacheUsed -= SPHSeries._nbytes(sph)
+        while self._cacheUsed > self._cacheBytes and len(self._ready) > 0:
+            sph = self._ready.pop(max(self._ready))
+            self._cacheUsed -= SPHSeries._nbytes(sph)
+        return
+
+    def _schedule(self, idx):
+        """
+        start background loading of the steps following idx, and drop
+        pending and prefetched loads outside of the new prefetch window.
+        caller must hold the lock.
+        """
+        window = range(idx + 1, min(idx + 1 + max(0, self._prefetch),
+                                    len(self._paths)))
+        for i in list(self._pending.keys()):
+            if i in window:
+                continue
+            # a running load can not be cancelled; its result is dropped
+            self._pending.pop(i).cancel()
+            continue # end of for(i)
+        for i in list(self._ready.keys()):
+            if i in window:
+                continue
+            self._cacheUsed -= SPHSeries._nbytes(self._ready.pop(i))
+            continue # end of for(i)
+        if self._prefetch < 1: return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        for i in window:
+            if i in self._cache or i in self._ready or i in self._pending:
+                continue
+            fut = self._executor.submit(self._load, i)
+            self._pending[i] = fut
+            fut.add_done_callback(
+                lambda f, i=i: self._prefetched(i, f))
+            continue # end of for(i)
+        return
+
+    def _prefetched(self, idx, fut):
+        """
+        keep a completed prefetch until get() consumes it, counting it
+        against the budget
+        """
+        with self._lock:
+            if self._pending.get(idx) is not fut:
+                return  # already taken by get() or dropped
+            del self._pending[idx]
+            if fut.cancelled() or fut.exception() is not None:
+                return
+            sph = fut.result()
+            if sph is None or idx in self._cache:
+                return
+            self._ready[idx] = sph
+            self._cacheUsed += SPHSeries._nbytes(sph)
+            self._evict()
+        return
+
+    def get(self, idx):
+        """
+        get idx-th step, loading it if not cached
+         @param idx: step index (negative index is allowed)
+         @returns: SPH.SPH, or None for failed.
+        """
+        if idx < 0: idx += len(self._paths)
+        if idx < 0 or idx >= len(self._paths):
+            raise IndexError('SPHSeries index out of range')
+
+        with self._lock:
+            sph = self._cache.get(idx)
+            if sph is not None:
+                self._cache.move_to_end(idx)
+                self._schedule(idx)
+                return sph
+            sph = self._ready.pop(idx, None)
+            if sph is not None:
+                # already counted in cacheUsed
+                self._cache[idx] = sph
+                self._evict()
+                self._schedule(idx)
+                return sph
+            fut = self._pending.pop(idx, None)
+
+        if fut is not None:
+            sph = fut.result()
+        else:
+            sph = self._load(idx)
+        if sph is None:
+            return None
+
+        with self._lock:
+            if idx not in self._cache:
+                self._cache[idx] = sph
+                self._cacheUsed += SPHSeries._nbytes(sph)
+            self._cache.move_to_end(idx)
+            self._evict()
+            self._schedule(idx)
+        return sph
+
+    def clear(self):
+        """
+        drop all cached steps
+        """
+        with self._lock:
+            self._cache.clear()
+            self._ready.clear()
+            self._cacheUsed = 0
+        return
+
+    def close(self):
+        """
+        stop background loading and drop all cached steps
+        """
+        with self._lock:
+            # cancel() runs the done callback, which looks up _pending
+            pending = list(self._pending.values())
+            self._pending.clear()
+            for fut in pending:
+                fut.cancel()
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.clear()
+        return
@@ -0,0 +1,335 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+single-pass statistics of SPH data with cached sidecar summaries
+"""
+from __future__ import print_function
+import os
+import json
+import numpy
+from . import SPH
+
+
+class SPHStats:
+    """
+    Per-component statistics of SPH data (min, max, mean, variance,
+    NaN/Inf counts and histogram) accumulated in one streaming pass
+    """
+
+    """ file name suffix of the sidecar summary """
+    SIDECAR_EXT = '.stats.json'
+
+    """ format version of the sidecar summary """
+    VERSION = 1
+
+    def __init__(self, veclen=1, bins=1024):
+        """
+        class initializer
+         @param veclen: vector length of the data
+         @param bins: number of histogram bins (rounded up to even)
+        """
+        self._veclen = veclen
+        self._bins = bins + (bins % 2)
+        self._count = [0] * veclen
+        self._min = [None] * veclen
+        self._max = [None] * veclen
+        self._mean = [0.0] * veclen
+        self._m2 = [0.0] * veclen
+        self._nan = [0] * veclen
+        self._inf = [0] * veclen
+        self._hlo = [None] * veclen
+        self._hhi = [None] * veclen
+        self._hist = [numpy.zeros(self._bins, dtype=numpy.int64)
+                      for _ in range(veclen)]
+        return
+
+    @property
+    def veclen(self):
+        return self._veclen
+
+    @property
+    def bins(self):
+        return self._bins
+
+    @property
+    def count(self):
+        """ number of finite values of each component """
+        return self._count
+
+    @property
+    def min(self):
+        return self._min
+
+    @property
+    def max(self):
+        return self._max
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def var(self):
+        """ population variance of each component """
+        return [self._m2[l] / self._count[l] if self._count[l] > 0 else 0.0
+                for l in range(self._veclen)]
+
+    @property
+    def nan(self):
+        return self._nan
+
+    @property
+    def inf(self):
+        return self._inf
+
+    def histogram(self, l=0):
+        """
+        histogram of a component
+         @param l: component index
+         @returns: (counts, bin edges)
+        """
+        if self._hlo[l] is None:
+            return (self._hist[l].copy(), None)
+        return (self._hist[l].copy(),
+                numpy.linspace(self._hlo[l], self._hhi[l], self._bins + 1))
+
+    def _histAdd(self, l, vals, weights=None):
+        """
+        add finite values to the histogram of component l, doubling the
+        histogram range until it covers the values
+        """
+        if vals.size < 1: return
+        vmin = float(vals.min())
+        vmax = float(vals.max())
+        if self._hlo[l] is None:
+            self._hlo[l] = vmin
+            self._hhi[l] = vmax
+            if vmax <= vmin:
+                self._hhi[l] = vmin + max(abs(vmin) * 1e-6, 1e-30)
+        hist = self._hist[l]
+        half = self._bins // 2
+        while vmin < self._hlo[l] or vmax > self._hhi[l]:
+            w = self._hhi[l] - self._hlo[l]
+            merged = hist[0::2] + hist[1::2]
+            hist[:] = 0
+            if vmin < self._hlo[l]:
+                hist[half:] = merged
+                self._hlo[l] -= w
+            else:
+                hist[:half] = merged
+                self._hhi[l] += w
+            continue # end of while
+        h, _ = numpy.histogram(vals, bins=self._bins,
+                               range=(self._hlo[l], self._hhi[l]),
+                               weights=weights)
+        hist += h.astype(numpy.int64)
+        return
+
+    def update(self, arr):
+        """
+        accumulate a chunk of data
+         @param arr: numpy.ndarray of shape (n, veclen) (or (n,) for veclen=1)
+        """
+        arr = numpy.asarray(arr).reshape((-1, self._veclen))
+        for l in range(self._veclen):
+            v = arr[:, l]
+            fin = numpy.isfinite(v)
+            nfin = int(fin.sum())
+            if nfin < v.size:
+                self._nan[l] += int(numpy.isnan(v).sum())
+                self._inf[l] += int(numpy.isinf(v).sum())
+                v = v[fin]
+            if nfin < 1:
+                continue
+            v = v.astype(numpy.float64)
+            cmin = float(v.min())
+            cmax = float(v.max())
+            cmean = float(v.mean())
+            cm2 = float(((v - cmean) ** 2).sum())
+            self._mergeMoments(l, nfin, cmin, cmax, cmean, cm2)
+            self._histAdd(l, v)
+            continue # end of for(l)
+        return
+
+    def _mergeMoments(self, l, n, vmin, vmax, mean, m2):
+        """
+        combine count/min/max/mean/M2 of component l with another set
+        """
+        na = self._count[l]
+        nt = na + n
+        if self._min[l] is None or vmin < self._min[l]: self._min[l] = vmin
+        if self._max[l] is None or vmax > self._max[l]: self._max[l] = vmax
+        delta = mean - self._mean[l]
+        self._mean[l] += delta * n / nt
+        self._m2[l] += m2 + delta * delta * na * n / nt
+        self._count[l] = nt
+        return
+
+    def merge(self, other):
+        """
+        merge statistics of other data (e.g. another time step).
+        histograms are merged by bin centers, so percentiles of the merged
+        statistics are approximate to the bin width.
+         @param other: SPHStats with the same veclen
+         @returns: True for succeed or False for failed.
+        """
+        if other._veclen != self._veclen: return False
+        for l in range(self._veclen):
+            self._nan[l] += other._nan[l]
+            self._inf[l] += other._inf[l]
+            if other._count[l] < 1:
+                continue
+            self._mergeMoments(l, other._count[l], other._min[l],
+                               other._max[l], other._mean[l], other._m2[l])
+            cnt, edges = other.histogram(l)
+            nz = cnt > 0
+            ctr = ((edges[:-1] + edges[1:]) / 2)[nz]
+            ctr = numpy.clip(ctr, other._min[l], other._max[l])
+            self._histAdd(l, ctr, weights=cnt[nz])
+            continue # end of for(l)
+        return True
+
+    def percentile(self, p, l=0):
+        """
+        percentile estimated from the histogram
+         @param p: percentile (0-100)
+         @param l: component index
+         @returns: estimated value, or None if there is no finite value
+        """
+        if self._count[l] < 1: return None
+        cnt, edges = self.histogram(l)
+        cum = numpy.cumsum(cnt)
+        target = p / 100.0 * cum[-1]
+        i = int(numpy.searchsorted(cum, target))
+        i = min(i, self._bins - 1)
+        prev = cum[i-1] if i > 0 else 0
+        frac = (target - prev) / cnt[i] if cnt[i] > 0 else 0.0
+        val = edges[i] + frac * (edges[i+1] - edges[i])
+        return float(min(max(val, self._min[l]), self._max[l]))
+
+    @staticmethod
+    def fromSPH(sph, bins=1024):
+        """
+        compute statistics of SPH data in one pass of IO_CHUNK sized chunks
+         @param sph: SPH.SPH (the data may be memory-mapped)
+         @param bins: number of histogram bins
+         @returns: SPHStats, or None for failed.
+        """
+        if sph._data is None: return None
+        st = SPHStats(sph._veclen, bins)
+        chunk = max(1, SPH.SPH.IO_CHUNK // sph._data.itemsize)
+        chunk -= chunk % sph._veclen
+        for piece in sph._dataPieces():
+            for s in range(0, piece.size, chunk):
+                st.update(piece[s:s+chunk])
+        return st
+
+    @staticmethod
+    def sidecarPath(path):
+        """
+        path of the sidecar summary of a .sph file
+        """
+        return path + SPHStats.SIDECAR_EXT
+
+    @staticmethod
+    def fromFile(path, bins=1024, rebuild=False, writeSidecar=True):
+        """
+        statistics of a .sph file. a valid sidecar summary is used if it
+        exists, otherwise the file is scanned through a memory map and the
+        summary is written next to the file.
+         @param path: file path of the .sph file
+         @param bins: number of histogram bins
+         @param rebuild: ignore the existing sidecar(default=False)
+         @param writeSidecar: write the sidecar after scanning(default=True)
+         @returns: SPHStats, or None for failed.
+        """
+        try:
+            fst = os.stat(path)
+        except OSError:
+            print("SPHStats.fromFile: stat failed: %s" % path)
+            return None
+        src = {'size': fst.st_size, 'mtime': fst.st_mtime}
+        scpath = SPHStats.sidecarPath(path)
+        if not rebuild and os.path.exists(scpath):
+            st = SPHStats.load(scpath, src)
+            if st is not None and st._bins == bins + (bins % 2):
+                return st
+
+        sph = SPH.SPH()
+        if not sph.load(path, mmap=True):
+            return None
+        st = SPHStats.fromSPH(sph, bins)
+        if st is not None and writeSidecar:
+            st.save(scpath, src)
+        return st
+
+    def save(self, path, source=None):
+        """
+        save the summary to a JSON file
+         @param path: file path
+         @param source: dict identifying the source file (size, mtime)
+         @returns: True for succeed or False for failed.
+        """
+        jd = {'version': SPHStats.VERSION, 'source': source,
+              'veclen': self._veclen, 'bins': self._bins,
+              'count': self._count, 'min': self._min, 'max': self._max,
+              'mean': self._mean, 'm2': self._m2,
+              'nan': self._nan, 'inf': self._inf,
+              'hlo': self._hlo, 'hhi': self._hhi,
+              'hist': [h.tolist() for h in self._hist]}
+        try:
+            with open(path, 'w') as ofp:
+                json.dump(jd, ofp)
+        except:
+            print("SPHStats.save: write failed: %s" % path)
+            return False
+        return True
+
+    @staticmethod
+    def load(path, source=None):
+        """
+        load the summary from a JSON file
+         @param path: file path
+         @param source: if not None, the summary is valid only when its
+                        recorded source equals this
+         @returns: SPHStats, or None for failed or stale summary.
+        """
+        try:
+            with open(path, 'r') as ifp:
+                jd = json.load(ifp)
+        except:
+            return None
+        if jd.get('version') != SPHStats.VERSION:
+            return None
+        if source is not None and jd.get('source') != source:
+            return None
+        st = SPHStats(jd['veclen'], jd['bins'])
+        st._count = jd['count']
+        st._min = jd['min']
+        st._max = jd['max']
+        st._mean = jd['mean']
+        st._m2 = jd['m2']
+        st._nan = jd['nan']
+        st._inf = jd['inf']
+        st._hlo = jd['hlo']
+        st._hhi = jd['hhi']
+        st._hist = [numpy.array(h, dtype=numpy.int64) for h in jd['hist']]
+        return st
+
+    @staticmethod
+    def globalStats(paths, bins=1024):
+        """
+        merged statistics of many .sph files (e.g. all time steps), using
+        and creating sidecar summaries
+         @param paths: list of .sph file paths
+         @param bins: number of histogram bins
+         @returns: SPHStats, or None for failed.
+        """
+        total = None
+        for p in paths:
+            st = SPHStats.fromFile(p, bins)
+            if st is None: return None
+            if total is None:
+                total = SPHStats(st._veclen, bins)
+            if not total.merge(st): return None
+        return total
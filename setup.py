@@ -5,6 +5,12 @@ from setuptools import Extension, setup
 import pybind11
 include_dirs = [pybind11.get_include()]
 library_dirs = []
+extra_compile_args = ['-std=c++14', '-fPIC']
+extra_link_args = []
+if sys.platform != 'darwin':
+    # OpenMP for the multithreaded kernels
+    extra_compile_args.append('-fopenmp')
+    extra_link_args.append('-fopenmp')
 
 ex_module = Extension(
     'pySPH.filter.filter_exmod',
@@ -12,7 +18,8 @@ ex_module = Extension(
     libraries=[],
     include_dirs=include_dirs,
     library_dirs=library_dirs,
-    extra_compile_args=['-std=c++14', '-fPIC'],
+    extra_compile_args=extra_compile_args,
+    extra_link_args=extra_link_args,
 )
 
 setup(name="pySPH",
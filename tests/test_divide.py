@@ -0,0 +1,61 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests of pySPH.filter.divide
+"""
+
+import numpy as np
+from pySPH import SPH
+from pySPH.filter import divide
+
+
+def _scalar():
+    d = SPH.SPH()
+    d.setNdarray(np.arange(7 * 6 * 5, dtype=np.float32).reshape((7, 6, 5)))
+    return d
+
+def test_mergeBlocks_roundtrip():
+    d = _scalar()
+    m = divide.mergeBlocks(divide.divideShareEdge(d, [2, 2, 2]))
+    assert m is not None
+    assert m.dims == d.dims
+    assert np.array_equal(m.data, d.data)
+
+def test_mergeBlocks_missing_block(tmp_path, capsys):
+    d = _scalar()
+    blks = divide.divideShareEdge(d, [2, 2, 2])
+    del blks[3]
+    assert divide.mergeBlocks(blks) is None
+    out = tmp_path / 'merged.sph'
+    assert divide.mergeBlocks(blks, outPath=str(out)) is None
+    assert not out.exists()
+    assert 'do not cover' in capsys.readouterr().out
+
+def test_divideShareEdge_block_view():
+    d = _scalar()
+    blk = divide.divideBlocks(d, [2, 2, 2], copy=False)[3]
+    assert blk.sph.data.ndim == 3
+    ref = divide.divideBlocks(d, [2, 2, 2], copy=True)[3]
+    sub = divide.divideShareEdge(blk.sph, [2, 1, 1])
+    exp = divide.divideShareEdge(ref.sph, [2, 1, 1])
+    assert len(sub) == len(exp) == 2
+    for a, b in zip(sub, exp):
+        assert a.dims == b.dims
+        assert np.array_equal(a.data, b.data)
+
+def test_mergeBlocks_edge_mismatch_removes_output(tmp_path, capsys):
+    blks = divide.divideShareEdge(_scalar(), [2, 2, 2])
+    blks[5]._data = blks[5]._data + 1.0
+    out = tmp_path / 'merged.sph'
+    assert divide.mergeBlocks(blks, outPath=str(out)) is None
+    assert not out.exists()
+    assert 'shared edge mismatch' in capsys.readouterr().out
+
+def test_mergeBlocks_record_limit(tmp_path, capsys):
+    big = SPH.SPH()
+    big._dims = [1024, 1024, 1024]
+    big._data = np.zeros(1, dtype=np.float32)
+    out = tmp_path / 'merged.sph'
+    assert divide.mergeBlocks([big], outPath=str(out)) is None
+    assert not out.exists()
+    assert '2GiB' in capsys.readouterr().out
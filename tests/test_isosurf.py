@@ -0,0 +1,48 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests of pySPH.isosurf
+"""
+
+import os
+import numpy as np
+from pySPH import SPH
+from pySPH.isosurf import SPH_isosurf
+
+
+def test_generateMulti_no_cache_file(tmp_path):
+    z, y, x = np.mgrid[0:12, 0:11, 0:10]
+    d = SPH.SPH()
+    d.setNdarray(np.sqrt((x-5.)**2 + (y-5.)**2 + (z-6.)**2)
+                 .astype(np.float32))
+    path = str(tmp_path / 'f.sph')
+    d.save(path)
+    r = SPH.SPH()
+    r.load(path)
+    res = SPH_isosurf.generateMulti(r, [2.5, 100.0], block=6)
+    assert len(res[0][1]) > 0 and len(res[1][1]) == 0
+    assert os.listdir(str(tmp_path)) == ['f.sph']
+    SPH_isosurf.generateMulti(r, [2.5], block=6, cache=True)
+    assert os.path.exists(path + '.mmidx.npz')
+
+def _face_set(verts, faces, ref):
+    ''' 最近接のrefの頂点番号で表した三角形の集合 '''
+    dist = ((verts[:, None, :] - ref[None, :, :]) ** 2).sum(axis=2)
+    near = dist.argmin(axis=1)
+    assert dist[np.arange(len(verts)), near].max() < 1e-8
+    return set(frozenset(t) for t in near[faces].tolist())
+
+def test_block_matches_single_shot():
+    z, y, x = np.meshgrid(np.linspace(0, 3, 40), np.linspace(0, 3, 37),
+                          np.linspace(0, 3, 33), indexing='ij')
+    d = SPH.SPH()
+    d.setNdarray((np.sin(x*1.3) + np.cos(y*1.7) + np.sin(z*0.9 + x*0.4))
+                 .astype(np.float32))
+    for v in (0.3, 1.1):
+        v0, f0, _ = SPH_isosurf.generate(d, v)
+        for b in (5, 8):
+            v1, f1, _ = SPH_isosurf.generate(d, v, block=b)
+            assert len(v1) == len(v0)
+            assert len(f1) == len(f0)
+            assert all(len(set(t)) == 3 for t in f1.tolist())
+            assert _face_set(v1, f1, v0) == _face_set(v0, f0, v0)
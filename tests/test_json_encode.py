@@ -0,0 +1,44 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests of pySPH.filter.json_encode
+"""
+
+import numpy as np
+from pySPH import SPH
+from pySPH.filter import json_encode, vecproc
+
+
+def _vector():
+    d = SPH.SPH()
+    d._dims = [5, 4, 3]
+    d._veclen = 3
+    d._pitch = [1.0, 1.0, 1.0]
+    d._data = np.arange(5 * 4 * 3 * 3, dtype=np.float32)
+    d._min = None
+    d._max = None
+    return d
+
+def test_roundtrip():
+    d = _vector()
+    for compress in (False, True):
+        r = json_encode.fromJSON(json_encode.toJSON(d, compress=compress))
+        assert r.dims == d.dims and r.veclen == 3
+        assert np.array_equal(r.data, d.data)
+
+def test_strided_view():
+    s = vecproc.extractScalar(_vector(), 1)
+    assert not s.data.flags.c_contiguous
+    r = json_encode.fromBinary(json_encode.toBinary(s))
+    assert np.array_equal(r.data, s.data)
+    r = json_encode.fromJSON(json_encode.toJSON(s, float32=True))
+    assert np.array_equal(r.data, s.data)
+
+def test_legacy_pickle_opt_in():
+    import json, base64, pickle
+    d = _vector()
+    sd = json.dumps({'type': 'sph',
+                     'data': base64.b64encode(pickle.dumps(d)).decode()})
+    assert json_encode.fromJSON(sd) is None
+    r = json_encode.fromJSON(sd, allow_pickle=True)
+    assert np.array_equal(r.data, d.data)
@@ -0,0 +1,35 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests of pySPH.lod
+"""
+
+import glob
+import numpy as np
+from pySPH import SPH
+from pySPH.lod import SPHPyramid
+
+
+def _save(tmp_path):
+    d = SPH.SPH()
+    d.setNdarray(np.random.default_rng(0).random((9, 8, 7),
+                                                 dtype=np.float32))
+    path = str(tmp_path / 'f000.sph')
+    d.save(path)
+    return d, path
+
+def test_levels_not_globbed(tmp_path):
+    _, path = _save(tmp_path)
+    assert SPHPyramid.build(path, 2) is not None
+    assert glob.glob(str(tmp_path / '*.sph')) == [path]
+
+def test_method_mismatch(tmp_path):
+    d, path = _save(tmp_path)
+    SPHPyramid.build(path, 1, method='mean')
+    lv = SPHPyramid.build(path, 1, method='max')
+    r = SPH.SPH()
+    r.load(lv[0])
+    ref = SPHPyramid.downsample(d, 2, 'max')
+    assert np.array_equal(r.data, ref.data)
+    p = SPHPyramid.loadPreview(path, 1, method='max')
+    assert p.path == lv[0]
@@ -0,0 +1,34 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests of pySPH.filter.scaproc
+"""
+
+import numpy as np
+from pySPH import SPH
+from pySPH.filter import scaproc, divide
+
+
+def test_asUchar_truncates():
+    d = SPH.SPH()
+    d.setNdarray(np.linspace(0.0, 1.0, 11))
+    assert scaproc.asUchar(d).tolist()[0][0] == \
+        [0, 25, 51, 76, 102, 127, 153, 178, 204, 229, 255]
+    assert scaproc.asUchar(d, rounding=True).tolist()[0][0][:4] == \
+        [0, 26, 51, 77]
+
+def test_asUchar_block_range():
+    d = SPH.SPH()
+    d.setNdarray(np.arange(8 * 6 * 5, dtype=np.float32).reshape((8, 6, 5)))
+    blk = divide.divideShareEdge(d, [1, 1, 2])[0]
+    u = scaproc.asUchar(blk)
+    assert u.min() == 0 and u.max() == 255
+
+def test_range_ends_map_to_full_scale():
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        d = SPH.SPH()
+        d.setNdarray((rng.random((6, 5, 7)) * 10 + 1).astype(np.float32))
+        u = scaproc.asUchar(d)
+        assert u.min() == 0 and u.max() == 255
+        assert scaproc.asUshort(d).max() == 65535
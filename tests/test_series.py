@@ -0,0 +1,47 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests of pySPH.series
+"""
+
+import threading
+import numpy as np
+from concurrent.futures import wait
+from pySPH import SPH
+from pySPH.series import SPHSeries
+
+
+class _CountingSeries(SPHSeries):
+    def __init__(self, *args, **kwargs):
+        SPHSeries.__init__(self, *args, **kwargs)
+        self.loads = []
+        self._countLock = threading.Lock()
+
+    def _load(self, idx):
+        with self._countLock:
+            self.loads.append(idx)
+        return SPHSeries._load(self, idx)
+
+def _files(tmp_path, n):
+    paths = []
+    for i in range(n):
+        d = SPH.SPH()
+        d.setNdarray(np.full((4, 4, 4), i, dtype=np.float32))
+        p = str(tmp_path / ('f%03d.sph' % i))
+        d.save(p)
+        paths.append(p)
+    return paths
+
+def test_sweep_full_cache(tmp_path):
+    paths = _files(tmp_path, 8)
+    step = 4 * 4 * 4 * 4
+    s = _CountingSeries(paths, cacheBytes=3 * step, prefetch=2)
+    for i in range(len(paths)):
+        sph = s.get(i)
+        assert sph.data[0] == i
+        with s._lock:
+            futs = list(s._pending.values())
+        wait(futs)
+        assert s.cacheUsed <= 3 * step
+    s.close()
+    assert sorted(s.loads) == list(range(len(paths)))
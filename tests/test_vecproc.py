@@ -0,0 +1,42 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests of pySPH.filter.vecproc
+"""
+
+import numpy as np
+import pytest
+from pySPH import SPH
+from pySPH.filter import vecproc
+
+
+def _vector():
+    d = SPH.SPH()
+    d._dims = [4, 5, 6]
+    d._pitch = [1.0, 1.0, 1.0]
+    d._veclen = 3
+    d._dtype = SPH.SPH.DT_DOUBLE
+    d._data = np.random.default_rng(0).random(4 * 5 * 6 * 3)
+    return d
+
+def _strided(d):
+    ''' 同じ値を持つ非連続なデータに置き換える '''
+    big = np.empty(d._data.size * 2, dtype=d._data.dtype)
+    big[::2] = d._data
+    d._data = big[::2]
+    return d
+
+@pytest.mark.skipif(vecproc.filter_exmod is None,
+                    reason='filter_exmod is not built')
+def test_vectorCurl_strided_double():
+    ref = vecproc.vectorCurl(_vector())
+    r = vecproc.vectorCurl(_strided(_vector()))
+    assert r._data.dtype == np.float64
+    assert np.array_equal(r._data, ref._data)
+
+def test_vortexFields_strided_double():
+    ref = vecproc.vortexFields(_vector())
+    res = vecproc.vortexFields(_strided(_vector()))
+    for name in ref:
+        assert res[name]._data.dtype == np.float64
+        assert np.allclose(res[name]._data, ref[name]._data)